@@ -1,4 +1,4 @@
-from collections import defaultdict
+from configuration import Configuration, GoldConfiguration, is_projective
 
 WORD  = 0
 POS   = 1
@@ -6,28 +6,6 @@ HEAD  = 2
 LABEL = 3
 ROOT  = -1
 
-class Configuration:
-
-    def __init__(self, root, buffer, sentence):
-        self.arcs = []
-        self.stack = [root]
-        self.buffer = buffer
-        self.sentence = sentence
-
-    def __str__(self):
-        ret = 'stack: ' + list(self.stack).__str__() + '\n'
-        ret += 'buffer: ' + list(self.buffer).__str__() + '\n'
-        ret += 'arcs: ' + self.arcs.__str__()
-        return ret
-
-
-class GoldConfiguration:
-
-    def __init__(self):
-        self.head_of = {}
-        self.deps_of = defaultdict(lambda : [])
-        self.arcs = set()
-
 
 class ArcEager:
     
@@ -52,18 +30,11 @@ class ArcEager:
         buffer is constructed with an extra root
         root is -1
         '''
-        buffer = list(range(len(sentence)))
-        return Configuration(ROOT, buffer, sentence)
+        return Configuration(ROOT, sentence)
 
     @staticmethod
     def get_gold_config(sentence):
-        gold_config = GoldConfiguration()
-        for i in xrange(len(sentence)):
-            head = sentence[i][HEAD]
-            gold_config.head_of[i] = head
-            gold_config.deps_of[head].append(i)
-            gold_config.arcs.add((head, i))
-        return gold_config
+        return GoldConfiguration([word[HEAD] for word in sentence])
 
     @staticmethod
     def is_finished(config):
@@ -75,25 +46,7 @@ class ArcEager:
 
     @staticmethod
     def is_not_projective(config):
-        for d1 in config.head_of.keys():
-            h1 = config.head_of[d1]
-            for d2 in config.head_of.keys():
-                h2 = config.head_of[d2]
-                if h1 is ROOT or h2 is ROOT:
-                    continue
-                # h1 h2 d1 d2
-                if h1 < h2 and h2 < d1 and d1 < d2:
-                    return True
-                # d1 h2 h1 d2
-                if d1 < h2 and h2 < h1 and h1 < d2:
-                    return True
-                # h1 d2 d1 h2
-                if h1 < d2 and d2 < d1 and d1 < h2:
-                    return True
-                # d1 d2 h1 h2
-                if d1 < d2 and d2 < h1 and h1 < h2:
-                    return True
-        return False
+        return not is_projective(config.head_of)
 
     @staticmethod
     def get_legal_transitions(config):
@@ -115,7 +68,7 @@ class ArcEager:
             if buffer_first is ROOT:
                 is_legal[ArcEager.RIGHT] = False
 
-            if len([h for h, t in config.arcs if t == buffer_first]) > 0:
+            if config.has_head(buffer_first):
                 is_legal[ArcEager.RIGHT] = False
 
         if len(config.stack) == 0:
@@ -131,7 +84,7 @@ class ArcEager:
             if stack_top is ROOT:
                 is_legal[ArcEager.LEFT] = False
 
-            if len([h for h, t in config.arcs if t == stack_top]) > 0:
+            if config.has_head(stack_top):
                 is_legal[ArcEager.LEFT] = False
             else:
                 is_legal[ArcEager.REDUCE] = False
@@ -146,9 +99,9 @@ class ArcEager:
         pop stack
         add (buffer_first, stack_top)
         '''
-        s = config.stack.pop()
+        s = config.pop()
         b = config.buffer[0]
-        config.arcs.append((b, s))
+        config.add_arc(b, s)
         return config
     
     @staticmethod
@@ -158,24 +111,22 @@ class ArcEager:
         add (stack_top, buffer_first)
         '''
         s = config.stack[-1]
-        b = config.buffer[0]
-        del config.buffer[0]
-        config.stack.append(b)
-        config.arcs.append((s, b))
+        b = config.shift_buffer()
+        config.push(b)
+        config.add_arc(s, b)
         return config
 
     @staticmethod
     def shift(config):
         ''' move buffer_first to stack '''
-        b = config.buffer[0]
-        del config.buffer[0]
-        config.stack.append(b)
+        b = config.shift_buffer()
+        config.push(b)
         return config
 
     @staticmethod
     def reduce(config):
         ''' pop stack '''
-        config.stack.pop()
+        config.pop()
         return config
 
     @staticmethod
@@ -204,9 +155,10 @@ class ArcEager:
             return [ArcEager.RIGHT]
         if gold_config.head_of[b] < s:
             return [ArcEager.REDUCE]
-        if b in gold_config.deps_of:
-            if len([x for x in gold_config.deps_of[b] if x < s]):
-                return [ArcEager.REDUCE]
+        # dependents are in increasing order, so it is enough to check
+        # whether the left-most one is left of s
+        if b in gold_config.deps_of and gold_config.deps_of[b][0] < s:
+            return [ArcEager.REDUCE]
         return [ArcEager.SHIFT]
 
     @staticmethod
@@ -240,12 +192,11 @@ class ArcEager:
         b = config.buffer[0]
         s = config.stack[-1]
         assert s is not ROOT
-        if (b, s) in gold_config.arcs:
+        head = gold_config.head_of[s]
+        if head == b:
             return 0
-        ks = [gold_config.head_of[s]]
-        ks += gold_config.deps_of[s]
-        cost = len(set(ks).intersection(set(config.buffer)))
-        return cost
+        counts = config.gold_counts(gold_config)
+        return (head in config.buffer) + counts.deps_in_buffer[s]
 
     @staticmethod
     def right_arc_cost(config, gold_config):
@@ -257,14 +208,12 @@ class ArcEager:
         b = config.buffer[0]
         s = config.stack[-1]
         assert b is not ROOT
-        if (s, b) in gold_config.arcs:
+        head = gold_config.head_of[b]
+        if head == s:
             return 0
-        cost = 0
-        cost += gold_config.head_of[b] in config.stack
-        cost += gold_config.head_of[b] in config.buffer
-        ks = set(gold_config.deps_of[b])
-        cost += len(ks.intersection(set(config.stack)))
-        return cost
+        counts = config.gold_counts(gold_config)
+        return (config.on_stack[head] + (head in config.buffer)
+                + counts.deps_on_stack[b])
 
     @staticmethod
     def shift_cost(config, gold_config):
@@ -273,12 +222,8 @@ class ArcEager:
         '''
         assert len(config.buffer) > 0
         b = config.buffer[0]
-        cost = 0
-        for k in config.stack:
-            cost += k == gold_config.head_of[b]
-            cost += k in gold_config.deps_of[b]
-        cost = max(0, cost)
-        return cost
+        counts = config.gold_counts(gold_config)
+        return config.on_stack[gold_config.head_of[b]] + counts.deps_on_stack[b]
 
     @staticmethod
     def reduce_cost(config, gold_config):
@@ -287,9 +232,7 @@ class ArcEager:
         '''
         assert len(config.stack) > 0
         s = config.stack[-1]
-        deps = set(gold_config.deps_of[s])
-        cost = len(deps.intersection(set(config.buffer)))
-        return cost
+        return config.gold_counts(gold_config).deps_in_buffer[s]
 
 
 if __name__ == '__main__':
@@ -1,31 +1,11 @@
+from configuration import Configuration, GoldConfiguration, is_projective
+
 WORD  = 0
 POS   = 1
 HEAD  = 2
 LABEL = 3
 ROOT  = -1
 
-class Configuration:
-
-    def __init__(self, root, buffer, sentence):
-        self.arcs = []
-        self.stack = [root]
-        self.buffer = buffer
-        self.sentence = sentence
-
-    def __str__(self):
-        ret = 'stack: ' + list(self.stack).__str__() + '\n'
-        ret += 'buffer: ' + list(self.buffer).__str__() + '\n'
-        ret += 'arcs: ' + self.arcs.__str__()
-        return ret
-
-
-class GoldConfiguration:
-
-    def __init__(self):
-        self.head_of = {}
-        self.deps_of = {}
-        self.arcs = set()
-
 
 class ArcStandard:
     
@@ -48,20 +28,11 @@ class ArcStandard:
         buffer is constructed with an extra root
         root is -1
         '''
-        buffer = list(range(len(sentence)))
-        return Configuration(ROOT, buffer, sentence)
+        return Configuration(ROOT, sentence)
 
     @staticmethod
     def get_gold_config(sentence):
-        gold_config = GoldConfiguration()
-        for i in xrange(len(sentence)):
-            head = sentence[i][HEAD]
-            gold_config.head_of[i] = head
-            if head not in gold_config.deps_of:
-                gold_config.deps_of[head] = []
-            gold_config.deps_of[head].append(i)
-            gold_config.arcs.add((head, i))
-        return gold_config
+        return GoldConfiguration([word[HEAD] for word in sentence])
 
     @staticmethod
     def is_finished(config):
@@ -73,25 +44,7 @@ class ArcStandard:
 
     @staticmethod
     def is_not_projective(config):
-        for d1 in config.head_of.keys():
-            h1 = config.head_of[d1]
-            for d2 in config.head_of.keys():
-                h2 = config.head_of[d2]
-                if h1 is ROOT or h2 is ROOT:
-                    continue
-                # h1 h2 d1 d2
-                if h1 < h2 and h2 < d1 and d1 < d2:
-                    return True
-                # d1 h2 h1 d2
-                if d1 < h2 and h2 < h1 and h1 < d2:
-                    return True
-                # h1 d2 d1 h2
-                if h1 < d2 and d2 < d1 and d1 < h2:
-                    return True
-                # d1 d2 h1 h2
-                if d1 < d2 and d2 < h1 and h1 < h2:
-                    return True
-        return False
+        return not is_projective(config.head_of)
 
     @staticmethod
     def get_legal_transitions(config):
@@ -113,7 +66,7 @@ class ArcStandard:
             if buffer_first is ROOT:
                 is_legal[ArcStandard.RIGHT] = False
 
-            if len([h for h, t in config.arcs if t == buffer_first]) > 0:
+            if config.has_head(buffer_first):
                 is_legal[ArcStandard.RIGHT] = False
 
 
@@ -129,7 +82,7 @@ class ArcStandard:
             if stack_top is ROOT:
                 is_legal[ArcStandard.LEFT] = False
 
-            if len([h for h, t in config.arcs if t == stack_top]) > 0:
+            if config.has_head(stack_top):
                 is_legal[ArcStandard.LEFT] = False
 
         legal_transitions = [trans for trans, legal in enumerate(is_legal)
@@ -142,9 +95,9 @@ class ArcStandard:
         pop stack
         add (buffer_first, stack_top)
         '''
-        s = config.stack.pop()
+        s = config.pop()
         b = config.buffer[0]
-        config.arcs.append((b, s))
+        config.add_arc(b, s)
         return config
     
     @staticmethod
@@ -153,19 +106,17 @@ class ArcStandard:
         pop stack, replace buffer_first with stack_top
         add (stack_top, buffer_first)
         '''
-        s = config.stack.pop()
+        s = config.pop()
         b = config.buffer[0]
-        del config.buffer[0]
-        config.buffer.insert(0, s)
-        config.arcs.append((s, b))
+        config.replace_buffer_front(s)
+        config.add_arc(s, b)
         return config
 
     @staticmethod
     def shift(config):
         ''' move buffer_first to stack '''
-        b = config.buffer[0]
-        del config.buffer[0]
-        config.stack.append(b)
+        b = config.shift_buffer()
+        config.push(b)
         return config
     
     @staticmethod
@@ -185,15 +136,14 @@ class ArcStandard:
         if len(config.stack) == 0:
             return [ArcStandard.SHIFT]
         s = config.stack[-1]
+        unattached = config.gold_counts(gold_config).unattached
         if s is not ROOT and b == gold_config.head_of[s]:
-            arcs = gold_config.arcs - set(config.arcs)
-            if len([t for h, t in arcs if h == s]) == 0:
+            if unattached[s] == 0:
                 return [ArcStandard.LEFT]
         if s == gold_config.head_of[b]:
             # to do a right arc (s, b), 
             # need to make sure b doesn' have head left
-            arcs = gold_config.arcs - set(config.arcs)
-            if len([t for h, t in arcs if h == b]) == 0:
+            if unattached[b] == 0:
                 return [ArcStandard.RIGHT]
         return [ArcStandard.SHIFT]
     
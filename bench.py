@@ -0,0 +1,527 @@
+import argparse
+import copy
+import json
+import random
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from multiprocessing import Pool
+import util
+from arc_standard import ArcStandard
+from arc_eager import ArcEager
+from parser import SimpleParser
+import feature_extractor as fx
+import decoders
+from train import train_parser
+
+
+def add_arguments(parser):
+    parser.add_argument("benchmark", choices=["beam", "ipm", "mst", "hot", "cutoff", "startup",
+                                                  "server"])
+    parser.add_argument("train_file", nargs="?", type=str, default="en.tr100")
+    parser.add_argument("test_file", nargs="?", type=str, default="en.tst")
+    parser.add_argument("-d", "--dev_file", type=str, default=None)
+    parser.add_argument("-i", "--iters", type=int, default=15)
+    parser.add_argument("-s", "--standard", action='store_true', default=False,
+                        help="arc-standard with baseline features instead of arc-eager "
+                             "with rich features")
+    parser.add_argument("-w", "--widths", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("-t", "--train_workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("-l", "--lengths", type=int, nargs="+", default=[25, 50, 100, 200],
+                        help="synthetic sentence lengths for the scaling benchmarks")
+    parser.add_argument("-f", "--cutoffs", type=int, nargs="+", default=[0, 1, 2, 3, 5],
+                        help="feature count cutoffs to compare, 0 for no pruning")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16],
+                        help="numbers of concurrent clients of the server benchmark")
+    parser.add_argument("--window", type=float, default=5,
+                        help="micro-batching window of the server benchmark in ms")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="write the hot path results to this JSON file")
+    parser.add_argument("-c", "--compare", type=str, default=None,
+                        help="JSON file of an earlier run to compare the hot path results with")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="time every hot path benchmark this many times and keep the fastest")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown (fraction of tokens/sec) reported as a regression")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+def build_parser(standard):
+    '''
+    the transparser.py (standard) or fancydep.py configuration
+    '''
+    if standard:
+        arcsys = ArcStandard()
+        return arcsys, SimpleParser(arcsys, fx.baseline, arcsys.static_oracle), False
+    arcsys = ArcEager()
+    return arcsys, SimpleParser(arcsys, fx.rich_incremental, arcsys.dynamic_oracle), True
+
+
+def trained_parser(args):
+    random.seed(321)
+    arcsys, parser, can_explore = build_parser(args.standard)
+    train_set = util.read_conll_data(args.train_file)
+    train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set)
+    train_parser(parser, train_set, train_gold_configs, args.iters,
+                 can_explore, 1, False)
+    parser.average_weights()
+    return arcsys, parser
+
+
+def accuracy(parser, arcsys, sentences):
+    total_arcs, correct_arcs = 0, 0
+    for sentence in sentences:
+        gold_config = arcsys.get_gold_config(sentence)
+        correct_arcs += len(set(parser.predict(sentence)) & gold_config.arcs)
+        total_arcs += len(sentence)
+    return correct_arcs * 1.0 / total_arcs
+
+
+def bench_beam(args):
+    '''
+    sentences/sec of predict on the test file for each beam width
+    '''
+    arcsys, parser = trained_parser(args)
+    test_set = util.read_conll_data(args.test_file)
+    dev_set = util.read_conll_data(args.dev_file) if args.dev_file else None
+    print 'width\tsents/sec\tdev acc'
+    for width in args.widths:
+        parser.beam_width = width
+        start = time.time()
+        for sentence in test_set:
+            parser.predict(sentence)
+        elapsed = time.time() - start
+        acc = '%.4f' % accuracy(parser, arcsys, dev_set) if dev_set else '-'
+        print '%d\t%.1f\t%s' % (width, len(test_set) / elapsed, acc)
+
+
+def bench_ipm(args):
+    '''
+    time-to-accuracy of serial training (1) against iterative parameter
+    mixing over n workers: training time and dev accuracy of the
+    averaged weights after every epoch
+    '''
+    dev_set = util.read_conll_data(args.dev_file or 'en.dev')
+    print 'workers\tepoch\ttrain sec\tdev acc'
+    for workers in args.train_workers:
+        random.seed(321)
+        arcsys, parser, can_explore = build_parser(args.standard)
+        train_set = util.read_conll_data(args.train_file)
+        train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set)
+        clock = {'start': time.time(), 'train': 0.0}
+
+        def evaluate(curr_iter):
+            clock['train'] += time.time() - clock['start']
+            averaged = copy.deepcopy(parser)
+            averaged.average_weights()
+            acc = accuracy(averaged, arcsys, dev_set)
+            print '%d\t%d\t%.2f\t%.4f' % (workers, curr_iter, clock['train'], acc)
+            clock['start'] = time.time()
+
+        train_parser(parser, train_set, train_gold_configs, args.iters,
+                     can_explore, 1, False, workers, evaluate)
+
+
+def bench_mst(args):
+    '''
+    decoding time of the networkx spanning tree against chu_liu_edmonds
+    and eisner on the score matrices of the training file, after iters
+    epochs of graphparser training. the first two both find the best
+    tree, since the graph parser's features are undirected, so their
+    tree scores must agree; eisner only finds the best projective one
+    '''
+    import graphparser
+    weights = graphparser.Weights()
+    for _ in xrange(args.iters):
+        for G in graphparser.iterCoNLL(args.train_file):
+            graphparser.runOneExample(weights, G, quiet=True)
+    graphs = []
+    for G in graphparser.iterCoNLL(args.train_file):
+        G = graphparser.computeFullGraph(G)
+        graphparser.computeGraphEdgeWeights(G, weights)
+        graphs.append(G)
+
+    start = time.time()
+    nx_scores = []
+    for G in graphs:
+        mst = graphparser.predictWeightedGraph(G)
+        nx_scores.append(sum(G[i][j]['weight'] for i, j in mst.edges_iter()))
+    nx_time = time.time() - start
+
+    start = time.time()
+    matrices = [graphparser.scoreMatrix(G) for G in graphs]
+    matrix_time = time.time() - start
+    start = time.time()
+    cle_scores = [decoders.tree_score(scores, decoders.chu_liu_edmonds(scores))
+                  for scores in matrices]
+    cle_time = time.time() - start
+
+    start = time.time()
+    eisner_scores = [decoders.tree_score(scores, decoders.eisner(scores))
+                     for scores in matrices]
+    eisner_time = time.time() - start
+
+    agree = sum(abs(a - b) < 1e-6 for a, b in zip(nx_scores, cle_scores))
+    projective = sum(abs(a - b) < 1e-6 for a, b in zip(eisner_scores, cle_scores))
+    print 'decoder\tsec\tsents/sec'
+    print 'networkx\t%.3f\t%.1f' % (nx_time, len(graphs) / nx_time)
+    print 'cle\t%.3f\t%.1f' % (cle_time, len(graphs) / cle_time)
+    print 'eisner\t%.3f\t%.1f' % (eisner_time, len(graphs) / eisner_time)
+    print 'score matrices built in %.3f' % matrix_time
+    print 'tree scores agree on %d/%d sentences' % (agree, len(graphs))
+    print 'eisner reaches the cle score on %d/%d sentences' % (projective, len(graphs))
+
+
+def _cutoff_run(job):
+    '''
+    train and evaluate with one cutoff, in a fresh process so that its
+    peak RSS is its own
+    '''
+    args, cutoff = job
+    random.seed(321)
+    arcsys, parser, can_explore = build_parser(args.standard)
+    train_set = util.read_conll_data(args.train_file)
+    train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set)
+    if cutoff:
+        parser.prune(parser.count_features(train_set, train_gold_configs), cutoff)
+    train_parser(parser, train_set, train_gold_configs, args.iters,
+                 can_explore, 1, False)
+    parser.average_weights()
+    if parser.frozen:
+        parser.compact()
+    dev_set = util.read_conll_data(args.dev_file or 'en.dev')
+    start = time.time()
+    acc = accuracy(parser, arcsys, dev_set)
+    elapsed = time.time() - start
+    tokens = sum(len(sentence) for sentence in dev_set)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    size = parser.weights[:parser.n_rows].nbytes / 2. ** 20
+    return parser.n_rows, size, rss, tokens / elapsed, acc
+
+
+def bench_cutoff(args):
+    '''
+    model size, peak RSS, parsing speed (tokens/sec, including the
+    accuracy bookkeeping) and dev accuracy for each feature cutoff
+    '''
+    print 'cutoff\tfeatures\tweights MB\tmax RSS MB\ttokens/sec\tdev acc'
+    for cutoff in args.cutoffs:
+        pool = Pool(1)
+        try:
+            features, size, rss, speed, acc = pool.map(_cutoff_run, [(args, cutoff)])[0]
+        finally:
+            pool.close()
+            pool.join()
+        print '%d\t%d\t%.1f\t%.1f\t%.0f\t%.4f' % (cutoff, features, size, rss, speed, acc)
+
+
+def latency_stats(tokens, latencies):
+    '''
+    tokens/sec and per-sentence p50/p99 latency (ms) of per-sentence timings
+    '''
+    latencies = np.array(latencies)
+    return {'tokens_per_sec': tokens / latencies.sum(),
+            'p50_ms': np.percentile(latencies, 50) * 1e3,
+            'p99_ms': np.percentile(latencies, 99) * 1e3}
+
+
+def time_sentences(items, fn, repeat=1):
+    '''
+    latency_stats of fn(item) for (n_tokens, item) pairs, one per sentence,
+    keeping the fastest of repeat runs over all items to cut noise
+    '''
+    best = None
+    for _ in xrange(repeat):
+        latencies = []
+        for n, item in items:
+            start = time.time()
+            fn(item)
+            latencies.append(time.time() - start)
+        if best is None or sum(latencies) < sum(best):
+            best = latencies
+    return latency_stats(sum(n for n, _ in items), best)
+
+
+def oracle_paths(arcsys, sentences):
+    '''
+    (sentence, gold_config, configs, transitions) along the static oracle
+    path of every projective sentence. the configs carry their oracle
+    bookkeeping, as they would in training
+    '''
+    paths = []
+    for sentence in sentences:
+        gold_config = arcsys.get_gold_config(sentence)
+        if arcsys.is_not_projective(gold_config):
+            continue
+        config = arcsys.get_initial_config(sentence)
+        config.gold_counts(gold_config)
+        configs, transitions = [], []
+        while not arcsys.is_finished(config):
+            oracle = arcsys.static_oracle(config, gold_config)
+            if not oracle or not arcsys.get_legal_transitions(config):
+                break
+            configs.append(config.copy())
+            transitions.append(oracle[0])
+            config = arcsys.take_transition(config, oracle[0])
+        paths.append((sentence, gold_config, configs, transitions))
+    return paths
+
+
+def synthetic_sentence(tokens, length, rng):
+    '''
+    a sentence of length tokens drawn from tokens, as a right-branching chain
+    '''
+    words = [tokens[rng.randint(len(tokens))] for _ in xrange(length)]
+    return [(w[0], w[1], i - 1, w[3], w[4], w[5]) for i, w in enumerate(words)]
+
+
+def git_commit():
+    # outside a checkout git's complaint would end up in the benchmark output
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                           stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_hot(args):
+    '''
+    tokens/sec and per-sentence p50/p99 latency of the parser's hot paths
+    on the dev file (feature extraction, scoring, legality, transitions,
+    oracles, predict), of a graphparser epoch on the training file, and
+    of predict and the graph decoders on synthetic long sentences
+    results are written to --output as JSON, and compared against the
+    results of an earlier run given with --compare
+    '''
+    dev_set = util.read_conll_data(args.dev_file or 'en.dev')
+    results = {}
+
+    for standard in (True, False):
+        random.seed(321)
+        arcsys, parser, can_explore = build_parser(standard)
+        train_set = util.read_conll_data(args.train_file)
+        train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set)
+        train_parser(parser, train_set, train_gold_configs, args.iters,
+                     can_explore, 1, False)
+        parser.average_weights()
+        name = 'standard' if standard else 'eager'
+        paths = oracle_paths(arcsys, dev_set)
+
+        def each_config(fn):
+            def run(configs):
+                for config in configs:
+                    fn(config)
+            return time_sentences([(len(p[0]), p[2]) for p in paths], run, args.repeat)
+
+        def each_fex(fex):
+            # one fex_cache per sentence, carried along the path as the
+            # parser does, and started cold in every repeat
+            def run(configs):
+                cache = None
+                for config in configs:
+                    config.fex_cache = cache
+                    fex(config)
+                    cache = config.fex_cache
+            return time_sentences([(len(p[0]), p[2]) for p in paths], run, args.repeat)
+
+        # rich as the reference for the incremental extractor
+        for fex in [parser.fex] if standard else [fx.rich, parser.fex]:
+            results['%s/fex.%s' % (name, fex.__name__)] = each_fex(fex)
+        results['%s/get_legal_transitions' % name] = each_config(arcsys.get_legal_transitions)
+        features = [(len(p[0]), [parser.fex(c) for c in p[2]]) for p in paths]
+
+        def score(batch):
+            for f in batch:
+                parser.score(f)
+        results['%s/score' % name] = time_sentences(features, score, args.repeat)
+
+        def take_transitions(path):
+            sentence, _, _, transitions = path
+            config = arcsys.get_initial_config(sentence)
+            for t in transitions:
+                config = arcsys.take_transition(config, t)
+        results['%s/take_transition' % name] = time_sentences(
+            [(len(p[0]), p) for p in paths], take_transitions, args.repeat)
+
+        oracles = [('static_oracle', arcsys.static_oracle)]
+        if can_explore:
+            oracles.append(('dynamic_oracle', arcsys.dynamic_oracle))
+        for oracle_name, oracle in oracles:
+            def run_oracle(path):
+                for config in path[2]:
+                    oracle(config, path[1])
+            results['%s/%s' % (name, oracle_name)] = time_sentences(
+                [(len(p[0]), p) for p in paths], run_oracle, args.repeat)
+
+        results['%s/predict' % name] = time_sentences(
+            [(len(s), s) for s in dev_set], parser.predict, args.repeat)
+
+        rng = np.random.RandomState(0)
+        tokens = [w for s in dev_set for w in s]
+        for length in args.lengths:
+            sentences = [synthetic_sentence(tokens, length, rng) for _ in xrange(20)]
+            results['%s/predict/len%d' % (name, length)] = time_sentences(
+                [(length, s) for s in sentences], parser.predict, args.repeat)
+
+    # epochs update the weights, so they are only timed once
+    import graphparser
+    graphs = list(graphparser.iterCoNLL(args.train_file))
+    weights = graphparser.Weights()
+    results['graph/epoch'] = time_sentences(
+        [(G.number_of_nodes() - 1, G) for G in graphs],
+        lambda G: graphparser.runOneExample(weights, G, quiet=True))
+    examples = [graphparser.graphEdgeFeatures(G) for G in graphs]
+    sparse_weights = np.zeros(2 ** 20)
+    for decoder_name, decoder in sorted(decoders.DECODERS.items()):
+        results['graph/sparse_epoch.%s' % decoder_name] = time_sentences(
+            [(ex.n - 1, ex) for ex in examples],
+            lambda ex: graphparser.runOneExampleSparse(sparse_weights, ex, decoder))
+    rng = np.random.RandomState(0)
+    for length in args.lengths:
+        matrices = [rng.randn(length + 1, length + 1) for _ in xrange(10)]
+        for decoder_name, decoder in sorted(decoders.DECODERS.items()):
+            results['graph/%s/len%d' % (decoder_name, length)] = time_sentences(
+                [(length, m) for m in matrices], decoder, args.repeat)
+
+    print 'benchmark\ttokens/sec\tp50 ms\tp99 ms'
+    for key in sorted(results):
+        r = results[key]
+        print '%s\t%.0f\t%.3f\t%.3f' % (key, r['tokens_per_sec'], r['p50_ms'], r['p99_ms'])
+    report = {'commit': git_commit(), 'time': time.time(), 'python': sys.version.split()[0],
+              'train_file': args.train_file, 'iters': args.iters, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if args.compare:
+        compare_results(json.load(open(args.compare))['results'], results, args.tolerance)
+
+
+def compare_results(before, after, tolerance):
+    '''
+    print the change in tokens/sec of every benchmark in both runs,
+    flagging slowdowns by more than tolerance
+    '''
+    print
+    print 'benchmark\tbefore\tafter\tchange'
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key]['tokens_per_sec'], after[key]['tokens_per_sec']
+        change = new / old - 1
+        flag = '\tREGRESSION' if change < -tolerance else ''
+        print '%s\t%.0f\t%.0f\t%+.1f%%%s' % (key, old, new, change * 100, flag)
+
+
+def bench_startup(args):
+    '''
+    time to the first parsed sentence of cli.py parse on the test file
+    with a saved model, from launching the process, next to the import
+    and model loading times it is made of and the time for the whole
+    file. the fastest of --repeat runs is kept. also reports any of the
+    modules parsing is not supposed to need that were imported anyway
+    '''
+    arcsys, parser = trained_parser(args)
+    tmp = tempfile.mkdtemp()
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    try:
+        parser.save(os.path.join(tmp, 'model'))
+        timing_path = os.path.join(tmp, 'timing.json')
+        best = {}
+        for _ in xrange(args.repeat):
+            launch = time.time()
+            subprocess.check_call([sys.executable, cli, 'parse', os.path.join(tmp, 'model'),
+                                   args.test_file, os.path.join(tmp, 'out'),
+                                   '--timing', timing_path])
+            with open(timing_path) as f:
+                timing = json.load(f)
+            # the child's times count from its own start, after python started
+            python = timing['start'] - launch
+            for key in ['imported', 'loaded', 'first_sentence', 'total']:
+                best[key] = min(best.get(key, float('inf')), timing[key] + python)
+            best['python'] = min(best.get('python', float('inf')), python)
+    finally:
+        shutil.rmtree(tmp)
+    print 'stage\tsec after launch'
+    for key in ['python', 'imported', 'loaded', 'first_sentence', 'total']:
+        print '%s\t%.3f' % (key, best[key])
+    print '%d sentences, %d tokens' % (timing['sentences'], timing['tokens'])
+    if timing['modules']:
+        print 'imported by parse:', ' '.join(timing['modules'])
+
+
+def bench_server(args):
+    '''
+    sentences/sec, tokens/sec and client-side p50/p99 latency of a local
+    parse server for each number of concurrent clients, each sending the
+    test file one sentence per request, alternately as JSON tokens and
+    as CoNLL, with the server's mean batch size. the answers are checked
+    against predict_batch. the first row parses directly, without a server
+    '''
+    import threading
+    import server
+    arcsys, parser = trained_parser(args)
+    test_set = [s for s in util.read_conll_data(args.test_file) if len(s) > 0]
+    n_tokens = sum(len(s) for s in test_set)
+    start = time.time()
+    arcs = parser.predict_batch(test_set)
+    expected = [server.heads_of(s, a) for s, a in zip(test_set, arcs)]
+    elapsed = time.time() - start
+    print 'clients\tsents/sec\ttokens/sec\tp50 ms\tp99 ms\tsents/batch\twrong'
+    print 'direct\t%.1f\t%.0f\t\t\t%d\t0' % (len(test_set) / elapsed, n_tokens / elapsed,
+                                               len(test_set))
+    for clients in args.clients:
+        parse_server = server.make_server(parser, ('127.0.0.1', 0), args.window / 1e3)
+        thread = threading.Thread(target=parse_server.serve_forever)
+        thread.start()
+        client = server.ParseClient(parse_server.server_address)
+        latencies = []
+        wrong = []
+
+        def run_client(c):
+            for i in xrange(c, len(test_set), clients):
+                sentence = test_set[i]
+                request_start = time.time()
+                if i % 2:
+                    heads = client.parse([[(word[4], word[1]) for word in sentence]])[0]
+                else:
+                    reply = client.parse_conll(util.format_conll(sentence, []), 'json')
+                    heads = reply['sentences'][0]['heads']
+                latencies.append(time.time() - request_start)
+                if heads != expected[i]:
+                    wrong.append(i)
+        threads = [threading.Thread(target=run_client, args=(c,)) for c in xrange(clients)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        stats = client.stats()
+        parse_server.shutdown()
+        parse_server.server_close()
+        thread.join()
+        print '%d\t%.1f\t%.0f\t%.2f\t%.2f\t%.1f\t%d' % (
+            clients, len(test_set) / elapsed, n_tokens / elapsed,
+            np.percentile(latencies, 50) * 1e3, np.percentile(latencies, 99) * 1e3,
+            stats['sentences_per_batch'], len(wrong))
+
+
+BENCHMARKS = {'beam': bench_beam, 'ipm': bench_ipm, 'mst': bench_mst, 'hot': bench_hot,
+              'cutoff': bench_cutoff, 'startup': bench_startup, 'server': bench_server}
+
+
+def main(args):
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main(parse_args())
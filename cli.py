@@ -0,0 +1,252 @@
+'''
+one command line for the parsers:
+
+    python cli.py train [--system eager|standard] [train.py options]
+    python cli.py parse MODEL INPUT [OUTPUT]
+    python cli.py serve MODEL [--port PORT | --unix PATH]
+    python cli.py graph TRAIN [DEV] [--decoder cle|eisner]
+    python cli.py eval REF OUT [OUT ...]
+    python cli.py bench BENCHMARK [bench.py options]
+
+every command imports only the modules it needs, so parse reads a model
+saved with train -o and starts parsing without loading networkx, the
+graph parser, the evaluator or the benchmarks. graph trains the sparse
+graph parser of graphparser.py with a decoder of decoders.py, which does
+not need networkx either
+'''
+import time
+
+START = time.time()
+
+import argparse
+import json
+import os
+import sys
+
+# the transparser.py and fancydep.py configurations, as (module and class
+# of the transition system, feature extractor, oracle, can explore)
+SYSTEMS = {'standard': ('arc_standard', 'ArcStandard', 'baseline', 'static_oracle', False),
+           'eager': ('arc_eager', 'ArcEager', 'rich_incremental', 'dynamic_oracle', True)}
+
+# modules that parse is not supposed to load, reported by --timing
+HEAVY_MODULES = ['networkx', 'graphparser', 'depeval', 'bench', 'train', 'profiling']
+
+
+def arcsys_class(system):
+    module, name = SYSTEMS[system][:2]
+    return getattr(__import__(module), name)
+
+
+def build_parser(system):
+    '''
+    arcsys, parser and can_explore of one of the SYSTEMS
+    '''
+    from parser import SimpleParser
+    import feature_extractor as fx
+    _, _, fex, oracle, can_explore = SYSTEMS[system]
+    arcsys = arcsys_class(system)()
+    return arcsys, SimpleParser(arcsys, getattr(fx, fex), getattr(arcsys, oracle)), can_explore
+
+
+def model_system(path):
+    '''
+    the system a model saved with SimpleParser.save was trained with,
+    told apart by its transitions
+    '''
+    with open(os.path.join(path, 'model.json')) as f:
+        transitions = json.load(f)['transitions']
+    for system in sorted(SYSTEMS):
+        if arcsys_class(system).TRANSITION_NAMES == transitions:
+            return system
+    raise ValueError('no system has the transitions %s' % transitions)
+
+
+def train(argv):
+    import train
+    parser = argparse.ArgumentParser(prog='cli.py train')
+    parser.add_argument("--system", choices=sorted(SYSTEMS), default='eager',
+                        help="transition system, features and oracle (default eager)")
+    train.add_arguments(parser)
+    args = parser.parse_args(argv)
+    train.check_arguments(parser, args, SYSTEMS[args.system][4])
+    arcsys, simple_parser, can_explore = build_parser(args.system)
+    train.main(arcsys, simple_parser, can_explore, args)
+
+
+def parse(argv):
+    parser = argparse.ArgumentParser(prog='cli.py parse')
+    parser.add_argument("model", type=str, help="directory written by train -o")
+    parser.add_argument("input", type=str, help="CoNLL file to parse")
+    parser.add_argument("output", nargs="?", type=str, default=None,
+                        help="CoNLL output (default INPUT.out)")
+    parser.add_argument("--system", choices=sorted(SYSTEMS), default=None,
+                        help="system of the model (default: told from its transitions)")
+    parser.add_argument("-w", "--beam_width", type=int, default=1)
+    parser.add_argument("-j", "--workers", type=int, default=1)
+    parser.add_argument("-c", "--chunk_size", type=int, default=4096,
+                        help="largest number of sentences parsed together; chunks "
+                             "start at one sentence and double up to this")
+    parser.add_argument("-v", "--verbose", action='store_true', default=False)
+    parser.add_argument("--timing", type=str, default=None,
+                        help="write the startup and parsing times to this JSON file")
+    args = parser.parse_args(argv)
+    imported = time.time()
+
+    import util
+    system, simple_parser = load(args.model, args.system, args.beam_width)
+    loaded = time.time()
+
+    first = None
+    sentences = tokens = 0
+    with util.ConllWriter(args.output or args.input + '.out') as writer:
+        parsed = parse_stream(simple_parser, util.iter_conll_data(args.input),
+                              args.workers, args.chunk_size)
+        for sentence, arcs in parsed:
+            writer.write(sentence, arcs)
+            sentences += 1
+            tokens += len(sentence)
+            if first is None:
+                writer.flush()
+                first = time.time()
+    end = time.time()
+
+    timing = {'system': system, 'start': START, 'sentences': sentences, 'tokens': tokens,
+              'imported': imported - START, 'loaded': loaded - START,
+              'first_sentence': first - START if first is not None else None,
+              'total': end - START,
+              'modules': [m for m in HEAVY_MODULES if m in sys.modules]}
+    if args.verbose:
+        print 'model loaded after %.3fs' % timing['loaded']
+        if first is not None:
+            print 'first sentence parsed after %.3fs' % timing['first_sentence']
+        print 'parsed %d sentences in %.3fs, %.0f tokens/sec' % (
+            sentences, end - loaded, tokens / (end - loaded) if end > loaded else 0.)
+    if args.timing:
+        with open(args.timing, 'w') as f:
+            json.dump(timing, f, indent=1, sort_keys=True)
+
+
+def load(model, system=None, beam_width=1):
+    '''
+    the system and parser of a model saved with train -o
+    '''
+    from parser import load_parser
+    system = system or model_system(model)
+    arcsys, parser, _ = build_parser(system)
+    parser = load_parser(model, arcsys, parser.fex, parser.oracle)
+    parser.beam_width = beam_width
+    return system, parser
+
+
+def serve(argv):
+    import server
+    parser = argparse.ArgumentParser(prog='cli.py serve',
+                                     description='a parse server, see server.py')
+    parser.add_argument("model", type=str, help="directory written by train -o")
+    parser.add_argument("--system", choices=sorted(SYSTEMS), default=None,
+                        help="system of the model (default: told from its transitions)")
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument("--unix", type=str, default=None,
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--window", type=float, default=5,
+                        help="milliseconds a request waits for others to join its batch")
+    parser.add_argument("--max_batch", type=int, default=256,
+                        help="sentences after which a batch is parsed without waiting")
+    parser.add_argument("-w", "--beam_width", type=int, default=1)
+    parser.add_argument("-v", "--verbose", action='store_true', default=False,
+                        help="log every request")
+    args = parser.parse_args(argv)
+    system, simple_parser = load(args.model, args.system, args.beam_width)
+    address = args.unix or (args.host, args.port)
+    parse_server = server.make_server(simple_parser, address, args.window / 1e3,
+                                      args.max_batch, args.verbose)
+    print 'serving the %s model %s on %s' % (system, args.model, args.unix or
+                                            '%s:%d' % parse_server.server_address)
+    sys.stdout.flush()
+    try:
+        parse_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        parse_server.server_close()
+        if args.unix:
+            os.remove(args.unix)
+
+
+def parse_stream(parser, sentences, workers, chunk_size):
+    '''
+    yield (sentence, arcs) like train.parse_stream, but with chunks that
+    start at one sentence and double, so that the first sentence comes
+    out right away and later ones are still parsed in large batches
+    '''
+    import util
+    pool = parser.worker_pool(workers) if workers > 1 else None
+    try:
+        for chunk in util.chunks(sentences, chunk_size, first=1):
+            for sentence, arcs in zip(chunk, parser.predict_parallel(chunk, workers, pool)):
+                yield sentence, arcs
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def graph(argv):
+    import numpy as np
+    import decoders
+    import graphparser
+    parser = argparse.ArgumentParser(prog='cli.py graph',
+                                     description='train the sparse graph parser of graphparser.py')
+    parser.add_argument("train_file", nargs="?", type=str, default="en.tr100")
+    parser.add_argument("dev_file", nargs="?", type=str, default=None,
+                        help="count the edges the trained parser gets wrong on this file")
+    parser.add_argument("-i", "--iters", type=int, default=5)
+    parser.add_argument("--decoder", choices=sorted(decoders.DECODERS), default='cle')
+    parser.add_argument("-b", "--hash_bits", type=int, default=20)
+    args = parser.parse_args(argv)
+    decoder = decoders.DECODERS[args.decoder]
+    examples = list(graphparser.iterEdgeFeatures(args.train_file, 2 ** args.hash_bits))
+    weights = np.zeros(2 ** args.hash_bits)
+    for curr_iter in xrange(args.iters):
+        start = time.time()
+        errors = sum(graphparser.runOneExampleSparse(weights, ex, decoder) for ex in examples)
+        print curr_iter, 'errors', errors, 'in %.3fs' % (time.time() - start)
+    if args.dev_file:
+        errors = edges = 0
+        for ex in graphparser.iterEdgeFeatures(args.dev_file, 2 ** args.hash_bits):
+            errors += len(graphparser.sparseMistakes(weights, ex, decoder)[0])
+            edges += ex.n - 1
+        print 'dev: %d/%d edges wrong' % (errors, edges)
+
+
+def eval(argv):
+    import depeval
+    parser = argparse.ArgumentParser(prog='cli.py eval')
+    depeval.add_arguments(parser)
+    depeval.main(parser.parse_args(argv))
+
+
+def bench(argv):
+    import bench
+    parser = argparse.ArgumentParser(prog='cli.py bench')
+    bench.add_arguments(parser)
+    bench.main(parser.parse_args(argv))
+
+
+COMMANDS = [('train', train), ('parse', parse), ('serve', serve), ('graph', graph),
+            ('eval', eval), ('bench', bench)]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='cli.py', description='train, parse with, serve, evaluate and benchmark the parsers',
+        epilog='run cli.py COMMAND -h for the options of a command')
+    parser.add_argument("command", choices=[name for name, _ in COMMANDS])
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    dict(COMMANDS)[args.command](args.args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,342 @@
+from array import array
+import numpy as np
+
+ROOT    = -1
+NO_HEAD = -2
+NO_ITEM = -2
+
+
+class Buffer(object):
+    '''
+    the buffer is always a contiguous range of the sentence, plus at most
+    one token pushed back in front of it (arc-standard right_arc), so it
+    is stored as offsets instead of a list of indices
+    '''
+
+    __slots__ = ('front', 'start', 'end')
+
+    def __init__(self, start, end):
+        self.front = NO_ITEM
+        self.start = start
+        self.end = end
+
+    def copy(self):
+        buffer = Buffer(self.start, self.end)
+        buffer.front = self.front
+        return buffer
+
+    def __len__(self):
+        return self.end - self.start + (self.front != NO_ITEM)
+
+    def __getitem__(self, i):
+        if i == 0:
+            # the front, which the transitions and oracles ask for most
+            if self.front != NO_ITEM:
+                return self.front
+            if self.start < self.end:
+                return self.start
+            raise IndexError('buffer index out of range')
+        if i < 0:
+            i += len(self)
+        if self.front != NO_ITEM:
+            if i == 0:
+                return self.front
+            i -= 1
+        if i < 0 or self.start + i >= self.end:
+            raise IndexError('buffer index out of range')
+        return self.start + i
+
+    def __setitem__(self, i, value):
+        '''
+        only the front can be replaced
+        '''
+        if i != 0 or len(self) == 0:
+            raise IndexError('only the buffer front can be replaced')
+        if self.front == NO_ITEM:
+            self.start += 1
+        self.front = value
+
+    def __iter__(self):
+        if self.front != NO_ITEM:
+            yield self.front
+        for i in xrange(self.start, self.end):
+            yield i
+
+    def __contains__(self, i):
+        return i == self.front or self.start <= i < self.end
+
+    def popleft(self):
+        if self.front != NO_ITEM:
+            b = self.front
+            self.front = NO_ITEM
+            return b
+        if self.start >= self.end:
+            raise IndexError('pop from an empty buffer')
+        self.start += 1
+        return self.start - 1
+
+
+class Configuration(object):
+    '''
+    stack and buffer are only changed through push, pop, shift_buffer and
+    replace_buffer_front, which keep the on_stack bitmap (and the oracle
+    counts, once an oracle has asked for them) up to date
+    fex_cache is scratch space for a feature extractor, per sentence, so
+    it is shared by copies
+    '''
+
+    __slots__ = ('stack', 'buffer', 'sentence', 'head',
+                 'left_deps', 'right_deps', 'on_stack', 'counts', 'fex_cache')
+
+    def __init__(self, root, sentence):
+        self.stack = array('i', [root])
+        self.buffer = Buffer(0, len(sentence))
+        self.sentence = sentence
+        # per-token bookkeeping, one extra slot at the end so that
+        # root (-1) can be indexed directly
+        self.head = array('i', [NO_HEAD]) * (len(sentence) + 1)
+        self.left_deps = [[] for _ in xrange(len(sentence) + 1)]
+        self.right_deps = [[] for _ in xrange(len(sentence) + 1)]
+        self.on_stack = bytearray(len(sentence) + 1)
+        self.on_stack[root] = 1
+        self.counts = None
+        self.fex_cache = None
+
+    @property
+    def arcs(self):
+        '''
+        (head, dependent) pairs, built on demand from the head array
+        '''
+        return [(h, d) for d, h in enumerate(self.head[:-1]) if h != NO_HEAD]
+
+    def add_arc(self, head, dep):
+        '''
+        add arc (head, dep) and update head and dependent lists
+        dependents are appended nearest first: the last element of
+        left_deps is the left-most, the last of right_deps the right-most
+        the dependent list is replaced rather than appended to, since
+        copies of this configuration may share it
+        '''
+        self.head[dep] = head
+        if dep < head:
+            self.left_deps[head] = self.left_deps[head] + [dep]
+        else:
+            self.right_deps[head] = self.right_deps[head] + [dep]
+        counts = self.counts
+        if counts is not None and counts.gold_head[dep] == head:
+            counts.unattached[head] -= 1
+
+    def push(self, i):
+        self.stack.append(i)
+        self.on_stack[i] = 1
+        counts = self.counts
+        if counts is not None:
+            h = counts.gold_head[i]
+            if h != NO_HEAD:
+                counts.deps_on_stack[h] += 1
+
+    def pop(self):
+        i = self.stack.pop()
+        self.on_stack[i] = 0
+        counts = self.counts
+        if counts is not None:
+            h = counts.gold_head[i]
+            if h != NO_HEAD:
+                counts.deps_on_stack[h] -= 1
+        return i
+
+    def shift_buffer(self):
+        '''
+        pop and return the buffer front
+        '''
+        i = self.buffer.popleft()
+        counts = self.counts
+        if counts is not None:
+            h = counts.gold_head[i]
+            if h != NO_HEAD:
+                counts.deps_in_buffer[h] -= 1
+        return i
+
+    def replace_buffer_front(self, i):
+        '''
+        put i in place of the buffer front
+        '''
+        b = self.buffer[0]
+        self.buffer[0] = i
+        counts = self.counts
+        if counts is not None:
+            h = counts.gold_head[b]
+            if h != NO_HEAD:
+                counts.deps_in_buffer[h] -= 1
+            h = counts.gold_head[i]
+            if h != NO_HEAD:
+                counts.deps_in_buffer[h] += 1
+
+    def gold_counts(self, gold_config):
+        '''
+        the OracleCounts of this configuration against gold_config, built
+        on the first call and kept up to date by the transitions after it
+        '''
+        if self.counts is None:
+            self.counts = OracleCounts(self, gold_config)
+        return self.counts
+
+    def copy(self):
+        '''
+        copy that shares the sentence and the per-head dependent lists
+        '''
+        config = Configuration.__new__(Configuration)
+        config.stack = self.stack[:]
+        config.buffer = self.buffer.copy()
+        config.sentence = self.sentence
+        config.head = self.head[:]
+        config.left_deps = self.left_deps[:]
+        config.right_deps = self.right_deps[:]
+        config.on_stack = self.on_stack[:]
+        config.counts = None if self.counts is None else self.counts.copy()
+        config.fex_cache = self.fex_cache
+        return config
+
+    def has_head(self, i):
+        return self.head[i] != NO_HEAD
+
+    def __str__(self):
+        ret = 'stack: ' + list(self.stack).__str__() + '\n'
+        ret += 'buffer: ' + list(self.buffer).__str__() + '\n'
+        ret += 'arcs: ' + self.arcs.__str__()
+        return ret
+
+
+class OracleCounts(object):
+    '''
+    per-token counts of gold dependents that the oracle costs need, so
+    that each cost is a few lookups instead of set intersections:
+    unattached[h]      gold dependents of h not yet attached to h
+    deps_on_stack[h]   gold dependents of h on the stack
+    deps_in_buffer[h]  gold dependents of h in the buffer
+    all indexed like Configuration.head, with root in the last slot
+    '''
+
+    __slots__ = ('gold_head', 'unattached', 'deps_on_stack', 'deps_in_buffer')
+
+    def __init__(self, config, gold_config):
+        n = len(config.head) - 1
+        # gold heads with root's (none) in the last slot
+        self.gold_head = gold_config.head_of + array('i', [NO_HEAD])
+        self.unattached = array('i', [0]) * (n + 1)
+        self.deps_on_stack = array('i', [0]) * (n + 1)
+        self.deps_in_buffer = array('i', [0]) * (n + 1)
+        for d in xrange(n):
+            h = self.gold_head[d]
+            if config.head[d] != h:
+                self.unattached[h] += 1
+        for i in config.stack:
+            h = self.gold_head[i]
+            if h != NO_HEAD:
+                self.deps_on_stack[h] += 1
+        for i in config.buffer:
+            h = self.gold_head[i]
+            if h != NO_HEAD:
+                self.deps_in_buffer[h] += 1
+
+    def copy(self):
+        counts = OracleCounts.__new__(OracleCounts)
+        counts.gold_head = self.gold_head
+        counts.unattached = self.unattached[:]
+        counts.deps_on_stack = self.deps_on_stack[:]
+        counts.deps_in_buffer = self.deps_in_buffer[:]
+        return counts
+
+
+class Dependents(object):
+    '''
+    read-only head -> dependents mapping over the gold configuration's
+    arrays, heads without dependents map to an empty sequence
+    '''
+
+    __slots__ = ('offsets', 'deps')
+
+    def __init__(self, offsets, deps):
+        self.offsets = offsets
+        self.deps = deps
+
+    def __getitem__(self, head):
+        return self.deps[self.offsets[head + 1]:self.offsets[head + 2]]
+
+    def __contains__(self, head):
+        return self.offsets[head + 2] > self.offsets[head + 1]
+
+
+class GoldConfiguration(object):
+    '''
+    gold heads plus their dependents in CSR form: the dependents of
+    head h are deps[offsets[h + 1]:offsets[h + 2]], in increasing order
+    '''
+
+    __slots__ = ('head_of', 'offsets', 'deps', 'deps_of')
+
+    def __init__(self, heads):
+        n = len(heads)
+        self.head_of = array('i', heads)
+        counts = [0] * (n + 2)
+        for h in heads:
+            counts[h + 2] += 1
+        for i in xrange(1, n + 2):
+            counts[i] += counts[i - 1]
+        self.offsets = array('i', counts)
+        fill = counts[:]
+        deps = array('i', [0]) * n
+        for d, h in enumerate(heads):
+            deps[fill[h + 1]] = d
+            fill[h + 1] += 1
+        self.deps = deps
+        self.deps_of = Dependents(self.offsets, self.deps)
+
+    @property
+    def arcs(self):
+        return set((h, d) for d, h in enumerate(self.head_of))
+
+    def __getstate__(self):
+        return (self.head_of,)
+
+    def __setstate__(self, state):
+        self.__init__(state[0])
+
+
+def projective_mask(heads, offsets):
+    '''
+    for the sentences whose head arrays are concatenated in heads, with
+    sentence i at heads[offsets[i]:offsets[i + 1]], whether no two of its
+    arcs cross. arcs from root (and missing heads) are ignored
+    arcs of all sentences are sorted at once by (sentence, left end,
+    -right end); a single pass then keeps the right ends of the enclosing
+    arcs on a stack, and an arc crosses iff it ends past the innermost one
+    '''
+    heads = np.asarray(heads, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    sentence = np.repeat(np.arange(len(lengths)), lengths)
+    position = np.arange(len(heads)) - offsets[:-1][sentence]
+    keep = heads >= 0
+    sentence = sentence[keep]
+    left = np.minimum(heads, position)[keep]
+    right = np.maximum(heads, position)[keep]
+    order = np.lexsort((-right, left, sentence))
+    mask = np.ones(len(lengths), dtype=np.bool_)
+    current = -1
+    stack = []
+    for s, l, r in zip(sentence[order].tolist(), left[order].tolist(),
+                       right[order].tolist()):
+        if s != current:
+            current = s
+            stack = []
+        while stack and stack[-1] <= l:
+            stack.pop()
+        if stack and r > stack[-1]:
+            mask[s] = False
+        stack.append(r)
+    return mask
+
+
+def is_projective(heads):
+    return bool(projective_mask(heads, [0, len(heads)])[0])
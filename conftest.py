@@ -0,0 +1,43 @@
+import os
+import random
+import pytest
+import util
+from cli import build_parser
+from train import train_parser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def data_path(name):
+    return os.path.join(HERE, name)
+
+
+@pytest.fixture(scope='session')
+def train_set():
+    return util.read_conll_data(data_path('en.tr100'))
+
+
+@pytest.fixture(scope='session')
+def dev_set():
+    return util.read_conll_data(data_path('en.dev'))
+
+
+_trained = {}
+
+
+@pytest.fixture(scope='session', params=['standard', 'eager'])
+def trained(request, train_set):
+    '''
+    (arcsys, averaged parser) of a system of cli.SYSTEMS, trained for a
+    few epochs on en.tr100. shared by the whole session, so tests must
+    not change its weights
+    '''
+    system = request.param
+    if system not in _trained:
+        random.seed(321)
+        arcsys, parser, can_explore = build_parser(system)
+        sentences, gold_configs = util.filter_non_projective(arcsys, train_set)
+        train_parser(parser, sentences, gold_configs, 3, can_explore, 1, False)
+        parser.average_weights()
+        _trained[system] = arcsys, parser
+    return _trained[system]
@@ -0,0 +1,207 @@
+import numpy as np
+
+# decoders over an (n+1)x(n+1) score matrix, scores[h, d] being the score
+# of the arc from head h to dependent d, node 0 the root. they return the
+# head of every node as an int array, with -1 for the root
+
+
+def find_cycles(heads):
+    '''
+    nodes of every cycle in the graph given by heads, one array per cycle
+    '''
+    heads = np.asarray(heads).tolist()
+    # 0: not visited, 1: on the current path, 2: done
+    state = [0] * len(heads)
+    state[0] = 2
+    cycles = []
+    for start in xrange(1, len(heads)):
+        path = []
+        i = start
+        while state[i] == 0:
+            state[i] = 1
+            path.append(i)
+            i = heads[i]
+        if state[i] == 1:
+            cycles.append(np.array(path[path.index(i):]))
+        for j in path:
+            state[j] = 2
+    return cycles
+
+
+def _chu_liu_edmonds(scores):
+    '''
+    the dense O(n^2) form of Chu-Liu-Edmonds (Tarjan, 1977; Camerini et
+    al., 1979): every node keeps its best incoming arc, and cycles are
+    contracted one at a time into a new node, whose row and column take
+    the best arcs leaving and entering the cycle. contracting k nodes
+    costs O(kn) and fewer than 2n nodes are ever contracted. once the
+    first cycles are gone, every new cycle passes through a contracted
+    node, so it is found by following best heads from there. src and
+    dst keep the arc of the original graph behind every entry of the
+    growing score matrix, and the contractions are undone in reverse to
+    read off the tree
+    '''
+    n = len(scores)
+    m = 2 * n - 1
+    S = np.empty((m, m))
+    S.fill(-np.inf)
+    S[:n, :n] = scores
+    src = np.zeros((m, m), dtype=np.intp)
+    dst = np.zeros((m, m), dtype=np.intp)
+    src[:n, :n] = np.arange(n)[:, None]
+    dst[:n, :n] = np.arange(n)[None, :]
+    best = np.zeros(m, dtype=np.intp)
+    best[:n] = scores.argmax(0)
+    best[0] = -1
+    active = np.zeros(m, dtype=np.bool_)
+    active[:n] = True
+    parent = -np.ones(m, dtype=np.intp)
+    contractions = []
+
+    def contract(cycle):
+        c = n + len(contractions)
+        active[cycle] = False
+        rest = np.flatnonzero(active)
+        # entering the cycle at v replaces v's cycle arc
+        entering = S[np.ix_(rest, cycle)] - S[best[cycle], cycle]
+        v = cycle[entering.argmax(1)]
+        S[rest, c] = entering.max(1)
+        src[rest, c] = src[rest, v]
+        dst[rest, c] = dst[rest, v]
+        # leaving the cycle: the best cycle node to head every other node
+        u = cycle[S[np.ix_(cycle, rest)].argmax(0)]
+        S[c, rest] = S[u, rest]
+        src[c, rest] = src[u, rest]
+        dst[c, rest] = dst[u, rest]
+        contractions.append((c, cycle, src[best[cycle], cycle], dst[best[cycle], cycle]))
+        parent[cycle] = c
+        best[rest[np.in1d(best[rest], cycle)]] = c
+        best[c] = rest[S[rest, c].argmax()]
+        active[c] = True
+        return c
+
+    # the cycles of the first heads are disjoint, and after contracting
+    # them every new cycle passes through a node made since
+    new = [contract(cycle) for cycle in find_cycles(best[:n])]
+    while new:
+        c = new.pop()
+        if not active[c]:
+            continue
+        path = [c]
+        position = {c: 0}
+        i = best[c]
+        while i != 0 and i not in position:
+            position[i] = len(path)
+            path.append(i)
+            i = best[i]
+        if i != 0:
+            new.append(contract(np.array(path[position[i]:])))
+
+    # the incoming arc of every node, as (head, dependent) of the original graph
+    in_src = np.zeros(m, dtype=np.intp)
+    in_dst = np.zeros(m, dtype=np.intp)
+    nodes = np.flatnonzero(active)[1:]
+    in_src[nodes] = src[best[nodes], nodes]
+    in_dst[nodes] = dst[best[nodes], nodes]
+    for c, cycle, cycle_src, cycle_dst in reversed(contractions):
+        in_src[cycle] = cycle_src
+        in_dst[cycle] = cycle_dst
+        # the cycle node that holds the dependent of the arc entering c
+        v = in_dst[c]
+        while parent[v] != c:
+            v = parent[v]
+        in_src[v] = in_src[c]
+        in_dst[v] = in_dst[c]
+    heads = in_src[:n].copy()
+    heads[0] = -1
+    return heads
+
+
+def chu_liu_edmonds(scores):
+    '''
+    maximum spanning arborescence rooted at 0 (Chu and Liu, 1965;
+    Edmonds, 1967), i.e. the best non-projective tree
+    '''
+    scores = np.array(scores, dtype=np.float64)
+    scores[:, 0] = -np.inf
+    np.fill_diagonal(scores, -np.inf)
+    return _chu_liu_edmonds(scores)
+
+
+def eisner(scores):
+    '''
+    best projective tree (Eisner, 1996) in O(n^3). spans are filled in
+    order of width, and for each width the maximization over split
+    points is done for all spans at once, so that only the loop over
+    widths runs in python
+    complete[d][s, t] / incomplete[d][s, t] are the best scores of the
+    spans s..t headed by t (d = 0) or by s (d = 1), with the split
+    points kept in split_* for backtracking
+    '''
+    scores = np.array(scores, dtype=np.float64)
+    n = len(scores)
+    scores[:, 0] = -np.inf
+    complete = [np.zeros((n, n)), np.zeros((n, n))]
+    incomplete = [np.zeros((n, n)), np.zeros((n, n))]
+    split_complete = [np.zeros((n, n), dtype=np.intp), np.zeros((n, n), dtype=np.intp)]
+    split_incomplete = np.zeros((n, n), dtype=np.intp)
+
+    for width in xrange(1, n):
+        s = np.arange(n - width)
+        t = s + width
+        S = s[:, None]
+        T = t[:, None]
+        # split points k = s .. t - 1
+        K = S + np.arange(width)[None, :]
+
+        # incomplete span: an arc between s and t over two complete halves
+        values = complete[1][S, K] + complete[0][K + 1, T]
+        best = values.argmax(1)
+        value = values[s, best]
+        incomplete[0][s, t] = value + scores[t, s]
+        incomplete[1][s, t] = value + scores[s, t]
+        split_incomplete[s, t] = s + best
+
+        # complete span headed by t: complete s..k and incomplete k..t
+        values = complete[0][S, K] + incomplete[0][K, T]
+        best = values.argmax(1)
+        complete[0][s, t] = values[s, best]
+        split_complete[0][s, t] = s + best
+
+        # complete span headed by s: incomplete s..k and complete k..t
+        values = incomplete[1][S, K + 1] + complete[1][K + 1, T]
+        best = values.argmax(1)
+        complete[1][s, t] = values[s, best]
+        split_complete[1][s, t] = s + best + 1
+
+    heads = -np.ones(n, dtype=np.intp)
+    spans = [(0, n - 1, 1, True)]
+    while spans:
+        s, t, d, is_complete = spans.pop()
+        if s == t:
+            continue
+        if is_complete:
+            k = split_complete[d][s, t]
+            if d == 0:
+                spans.append((s, k, 0, True))
+                spans.append((k, t, 0, False))
+            else:
+                spans.append((s, k, 1, False))
+                spans.append((k, t, 1, True))
+        else:
+            k = split_incomplete[s, t]
+            if d == 0:
+                heads[s] = t
+            else:
+                heads[t] = s
+            spans.append((s, k, 1, True))
+            spans.append((k + 1, t, 0, True))
+    return heads
+
+
+# decoders by name, for command line options
+DECODERS = {'cle': chu_liu_edmonds, 'eisner': eisner}
+
+
+def tree_score(scores, heads):
+    return scores[heads[1:], np.arange(1, len(heads))].sum()
@@ -1,30 +1,159 @@
-import sys
+import argparse
+from itertools import izip_longest
+
+# gold tags of tokens that are left out with punct=False
+PUNCT_TAGS = frozenset(["``", "''", ",", ".", ":", "(", ")", "-LRB-", "-RRB-"])
+
+NO_HEAD = -2
+
+# the evaluator works on sentences as (heads, labels, tags), heads being
+# 0-based with -1 for root as in util, labels None if unlabeled and tags
+# only needed for the reference. the functions below turn files, util
+# sentences and parser output into such streams, one sentence at a time
+
+
+def conll_sentences(file_path):
+    '''
+    (heads, labels, tags) of the sentences of a CoNLL file
+    '''
+    with open(file_path) as f:
+        heads, labels, tags = [], [], []
+        for line in f:
+            row = line.strip().split('\t')
+            if len(row) == 1:
+                yield heads, labels, tags
+                heads, labels, tags = [], [], []
+                continue
+            heads.append(int(row[6]) - 1 if row[6] != '_' else NO_HEAD)
+            labels.append(row[7] if row[7] != '_' else None)
+            tags.append(row[4])
+        if len(heads) > 0:
+            yield heads, labels, tags
+
+
+def from_sentences(sentences):
+    '''
+    (heads, labels, tags) of sentences as read by util.iter_conll_data
+    '''
+    for sentence in sentences:
+        yield ([word[2] if word[2] != '_' else NO_HEAD for word in sentence],
+               [word[3] if word[3] != '_' else None for word in sentence],
+               [word[5] for word in sentence])
+
+
+def from_arcs(parsed):
+    '''
+    (heads, labels, tags) of (sentence, arcs) pairs as given by
+    train.parse_stream, which are unlabeled
+    '''
+    for sentence, arcs in parsed:
+        heads = [NO_HEAD] * len(sentence)
+        for h, d in arcs:
+            heads[d] = h
+        yield heads, [None] * len(sentence), None
+
+
+class EvalResult(object):
+    '''
+    counts of one system output against the reference. total counts the
+    scored tokens, tokens all of them, punctuation included
+    '''
+
+    def __init__(self):
+        self.sentences = 0
+        self.tokens = 0
+        self.total = 0
+        self.correct_heads = 0
+        self.correct_labeled = 0
+
+    def add(self, ref, out, punct=True):
+        ref_heads, ref_labels, ref_tags = ref
+        out_heads, out_labels, _ = out
+        assert len(ref_heads) == len(out_heads)
+        self.sentences += 1
+        self.tokens += len(ref_heads)
+        for i in xrange(len(ref_heads)):
+            if not punct and ref_tags[i] in PUNCT_TAGS:
+                continue
+            self.total += 1
+            if ref_heads[i] == out_heads[i]:
+                self.correct_heads += 1
+                if ref_labels[i] is not None and ref_labels[i] == out_labels[i]:
+                    self.correct_labeled += 1
+
+    @property
+    def uas(self):
+        return float(self.correct_heads) / self.total if self.total else 0.
+
+    @property
+    def las(self):
+        return float(self.correct_labeled) / self.total if self.total else 0.
+
+    def __str__(self):
+        return "%f%% (%d/%d)" % (self.uas * 100, self.correct_heads, self.total)
+
+
+def evaluate(reference, outputs, punct=True):
+    '''
+    EvalResults of every output stream against the reference stream, read
+    together in one pass and one sentence at a time
+    punct=False leaves out tokens whose gold tag is in PUNCT_TAGS
+    '''
+    results = [EvalResult() for _ in outputs]
+    for sentences in izip_longest(reference, *outputs):
+        assert all(s is not None for s in sentences), 'outputs differ in length'
+        ref = sentences[0]
+        for result, out in zip(results, sentences[1:]):
+            result.add(ref, out, punct)
+    return results
+
+
+def evaluate_parsed(parsed, punct=True):
+    '''
+    EvalResult of (sentence, arcs) pairs against the gold heads of the
+    sentences themselves, e.g. train.parse_stream on a dev set
+    '''
+    result = EvalResult()
+    for sentence, arcs in parsed:
+        ref, = from_sentences([sentence])
+        out, = from_arcs([(sentence, arcs)])
+        result.add(ref, out, punct)
+    return result
+
 
 def eval(ref_path,out_path):
-    ref_file = open(ref_path, "r")
-    refs = ref_file.readlines()
-    tst_file = open(out_path, "r")
-    tsts = tst_file.readlines()
-    assert len(tsts) == len(refs)
-
-    total = 0
-    correct = 0
-    for i, ref_line in enumerate(refs):
-        tst_line = tsts[i]
-        ref_line = ref_line.strip()
-        tst_line = tst_line.strip()
-        if len(ref_line) > 0:
-            (rnum, rname, rname1, rpos, rpos1, runder, rhead, rdep, rmore, rlast) = ref_line.split('\t')
-            (tnum, tname, tname1, tpos, tpos1, tunder, thead, tdep, tmore, tlast) = tst_line.split('\t')
-            total += 1
-            if rhead == thead:
-                correct += 1
-                                
-    print "%f%% (%d/%d)" % (float(correct)/total*100, correct, total)
-                                
-if __name__ == "__main__":
-    ref_path=sys.argv[1]
-    out_path=sys.argv[2]
+    print evaluate(conll_sentences(ref_path), [conll_sentences(out_path)])[0]
+
+
+def add_arguments(parser):
+    parser.add_argument("ref_path", type=str)
+    parser.add_argument("out_paths", type=str, nargs="+")
+    parser.add_argument("-p", "--no_punct", action='store_true', default=False,
+                        help="leave out punctuation tokens")
+    parser.add_argument("-l", "--labeled", action='store_true', default=False,
+                        help="print LAS as well")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    return parser.parse_args()
+
+
+def main(args):
     # ref_path = 'en.dev'
     # out_path = 'en.dev.out'
-    eval(ref_path,out_path)
+    results = evaluate(conll_sentences(args.ref_path),
+                       [conll_sentences(path) for path in args.out_paths],
+                       not args.no_punct)
+    for path, result in zip(args.out_paths, results):
+        prefix = path + '\t' if len(args.out_paths) > 1 else ''
+        line = prefix + str(result)
+        if args.labeled:
+            line += "\tLAS %f%% (%d/%d)" % (result.las * 100, result.correct_labeled,
+                                           result.total)
+        print line
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -6,5 +6,5 @@ from train import main
 
 if __name__ == '__main__':
     arcsys = ArcEager()
-    parser = SimpleParser(arcsys, fx.rich, arcsys.dynamic_oracle)
+    parser = SimpleParser(arcsys, fx.rich_incremental, arcsys.dynamic_oracle)
     main(arcsys, parser, True)
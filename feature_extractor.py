@@ -1,12 +1,14 @@
-from collections import defaultdict
+import numpy as np
 
 WORD  = 0
 POS   = 1
 HEAD  = 2
 LABEL = 3
 ROOT_ID  = -1
+NO_HEAD  = -2
 ROOT = "ROOT"
 NULL = "NULL"
+ROOT_WORD = (ROOT, ROOT)
 
 
 def sentence_to_dict(sentence):
@@ -14,18 +16,20 @@ def sentence_to_dict(sentence):
     convert a sentence (list) to a dict where -1 maps to ROOT
     '''
     s = dict((i, word) for i, word in enumerate(sentence))
-    s[ROOT_ID] = (ROOT, ROOT)
+    s[ROOT_ID] = ROOT_WORD
     return s
 
 
-def dep_info(arcs, head, sentence):
+def dep_info(config, head, sentence):
     '''
     get the left-most and right-most dependents of the given head
     '''
-    deps  = [d for h, d in arcs if h == head]
-    deps.sort()
-    vl = len([x for x in deps if x < head])
-    vr = len([x for x in deps if x > head])
+    # both dependent lists are kept nearest first by the configuration
+    left = config.left_deps[head]
+    right = config.right_deps[head]
+    deps = left[::-1] + right
+    vl = len(left)
+    vr = len(right)
     l0 = (NULL, NULL) if len(deps) == 0 else sentence[deps[0]]
     r0 = (NULL, NULL) if len(deps) == 0 else sentence[deps[-1]]
     l1 = (NULL, NULL) if len(deps) < 2 else sentence[deps[1]]
@@ -34,7 +38,9 @@ def dep_info(arcs, head, sentence):
 
 
 def baseline(config):
-    sentence = sentence_to_dict(config.sentence)
+    # only two tokens are looked up, so they are read from the sentence
+    # list instead of building sentence_to_dict for every configuration
+    sentence = config.sentence
     features = {}
 
     s0_word = NULL # top stack word
@@ -44,13 +50,15 @@ def baseline(config):
 
     if len(config.buffer) > 0:
         i = config.buffer[0]
-        b0_word = sentence[i][WORD]
-        b0_pos = sentence[i][POS]
+        word = sentence[i] if i != ROOT_ID else ROOT_WORD
+        b0_word = word[WORD]
+        b0_pos = word[POS]
 
     if len(config.stack) > 0:
         i = config.stack[-1]
-        s0_word = sentence[i][WORD]
-        s0_pos = sentence[i][POS]
+        word = sentence[i] if i != ROOT_ID else ROOT_WORD
+        s0_word = word[WORD]
+        s0_pos = word[POS]
 
     s0_word_b0_word = s0_word + b0_word
     s0_pos_b0_pos = s0_pos + b0_pos
@@ -88,9 +96,6 @@ def rich(config):
     n0wvl n0pvl s0wvl s0wvr s0pvl s0pvr
     '''
     sentence = sentence_to_dict(config.sentence)
-    head_of = defaultdict(lambda : (NULL, NULL))
-    for h, t in config.arcs:
-        head_of[t] = sentence[h]
 
     features = {}
 
@@ -131,7 +136,7 @@ def rich(config):
         i = config.buffer[0]
         n0w = sentence[i][WORD]
         n0p = sentence[i][POS]
-        l0, l1, r1, r0, vl, vr = dep_info(config.arcs, i, sentence)
+        l0, l1, r1, r0, vl, vr = dep_info(config, i, sentence)
         n0lw = l0[WORD]
         n0lp = l0[POS]
         n0l2w = l1[WORD]
@@ -153,7 +158,7 @@ def rich(config):
         i = config.stack[-1]
         s0w = sentence[i][WORD]
         s0p = sentence[i][POS]
-        l0, l1, r1, r0, vl, vr = dep_info(config.arcs, i, sentence)
+        l0, l1, r1, r0, vl, vr = dep_info(config, i, sentence)
         s0lw = l0[WORD]
         s0lp = l0[POS]
         s0rw = r0[WORD]
@@ -162,8 +167,9 @@ def rich(config):
         s0l2p = l1[POS]
         s0r2w = r1[WORD]
         s0r2p = r1[POS]
-        s0hw = head_of[i][WORD]
-        s0hp = head_of[i][POS]
+        if config.head[i] != NO_HEAD:
+            s0hw = sentence[config.head[i]][WORD]
+            s0hp = sentence[config.head[i]][POS]
         s0wvl = s0w + '-' + str(vl)
         s0wvr = s0w + '-' + str(vr)
         s0pvl = s0p + '-' + str(vl)
@@ -268,3 +274,169 @@ def rich(config):
     features['s0pvr=' + s0pvr] = 1
 
     return features
+
+
+class SentenceTable(object):
+    '''
+    per-sentence state of rich_incremental: the word and pos of every
+    token, with NULL at index NO_HEAD (-2) and ROOT at ROOT_ID (-1) so
+    that missing positions need no special case, and the template groups
+    built so far, keyed on the tokens and counts they read
+    '''
+
+    __slots__ = ('word', 'pos', 'groups')
+
+    def __init__(self, sentence):
+        self.word = [word[WORD] for word in sentence] + [NULL, ROOT]
+        self.pos = [word[POS] for word in sentence] + [NULL, ROOT]
+        self.groups = {}
+
+
+def _stack_group(table, s0, s1, s2):
+    W, P = table.word, table.pos
+    s0w, s1w, s2w, s0p, s1p, s2p = W[s0], W[s1], W[s2], P[s0], P[s1], P[s2]
+    return {'s0w=' + s0w: 1, 's1w=' + s1w: 1, 's2w=' + s2w: 1,
+            's0p=' + s0p: 1, 's1p=' + s1p: 1, 's2p=' + s2p: 1,
+            's0wp=' + s0w + ';' + s0p: 1, 's1wp=' + s1w + ';' + s1p: 1,
+            's2wp=' + s2w + ';' + s2p: 1}
+
+
+def _buffer_group(table, n0, n1, n2):
+    W, P = table.word, table.pos
+    n0w, n1w, n2w, n0p, n1p, n2p = W[n0], W[n1], W[n2], P[n0], P[n1], P[n2]
+    return {'n0w=' + n0w: 1, 'n1w=' + n1w: 1, 'n2w=' + n2w: 1,
+            'n0p=' + n0p: 1, 'n1p=' + n1p: 1, 'n2p=' + n2p: 1,
+            'n0wp=' + n0w + ';' + n0p: 1, 'n1wp=' + n1w + ';' + n1p: 1,
+            'n2wp=' + n2w + ';' + n2p: 1,
+            'n0pn1p=' + n0p + ';' + n1p: 1,
+            'n0pn1pn2p  =' + n0p + ';' + n1p + ';' + n2p: 1}
+
+
+def _s0_group(table, s0, h, l0, l1, r0, r1, vl, vr):
+    W, P = table.word, table.pos
+    if s0 != NO_HEAD:
+        s0w = W[s0]
+        s0p = P[s0]
+        s0wvl = s0w + '-' + str(vl)
+        s0wvr = s0w + '-' + str(vr)
+        s0pvl = s0p + '-' + str(vl)
+        s0pvr = s0p + '-' + str(vr)
+    else:
+        s0wvl = s0wvr = s0pvl = s0pvr = NULL
+    return {'s0hw=' + W[h]: 1, 's0hp=' + P[h]: 1,
+            's0lw=' + W[l0]: 1, 's0lp=' + P[l0]: 1, 's0rw=' + W[r0]: 1, 's0rp=' + P[r0]: 1,
+            's0l2w=' + W[l1]: 1, 's0l2p=' + P[l1]: 1, 's0r2w=' + W[r1]: 1, 's0r2p=' + P[r1]: 1,
+            's0wvl=' + s0wvl: 1, 's0wvr=' + s0wvr: 1, 's0pvl=' + s0pvl: 1, 's0pvr=' + s0pvr: 1}
+
+
+def _n0_group(table, n0, l0, l1, vl):
+    W, P = table.word, table.pos
+    if n0 != NO_HEAD:
+        n0wvl = W[n0] + '-' + str(vl)
+        n0pvl = P[n0] + '-' + str(vl)
+    else:
+        n0wvl = n0pvl = NULL
+    # n0l2p is always NULL in rich
+    return {'n0lw=' + W[l0]: 1, 'n0lp=' + P[l0]: 1, 'n0l2w=' + W[l1]: 1, 'n0l2p=' + NULL: 1,
+            'n0wvl=' + n0wvl: 1, 'n0pvl=' + n0pvl: 1}
+
+
+def rich_incremental(config):
+    '''
+    the features of rich, built from per-sentence tables instead of from
+    scratch. the single-word features of the stack and the buffer, and
+    the head, dependent and valency features of s0 and n0, are cached as
+    groups keyed on the tokens they read, so a transition only rebuilds
+    the groups whose tokens it changed (a REDUCE or LEFT-ARC leaves the
+    buffer groups as they were). the features that combine s0 with the
+    buffer change with nearly every transition and are built every time
+    '''
+    table = config.fex_cache
+    if table is None:
+        table = config.fex_cache = SentenceTable(config.sentence)
+    groups = table.groups
+    W, P = table.word, table.pos
+    stack = config.stack
+    buffer = config.buffer
+    n_stack = len(stack)
+    n_buffer = len(buffer)
+    s0 = stack[-1] if n_stack > 0 else NO_HEAD
+    s1 = stack[-2] if n_stack > 1 else NO_HEAD
+    s2 = stack[-3] if n_stack > 2 else NO_HEAD
+    n0 = buffer[0] if n_buffer > 0 else NO_HEAD
+    n1 = buffer[1] if n_buffer > 1 else NO_HEAD
+    n2 = buffer[2] if n_buffer > 2 else NO_HEAD
+
+    key = (0, s0, s1, s2)
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = _stack_group(table, s0, s1, s2)
+    features = dict(group)
+
+    key = (1, n0, n1, n2)
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = _buffer_group(table, n0, n1, n2)
+    features.update(group)
+
+    if s0 != NO_HEAD:
+        h = config.head[s0]
+        left = config.left_deps[s0]
+        right = config.right_deps[s0]
+        deps = left[::-1] + right
+        s0l0 = deps[0] if deps else NO_HEAD
+        s0r0 = deps[-1] if deps else NO_HEAD
+        s0l1 = deps[1] if len(deps) > 1 else NO_HEAD
+        s0r1 = deps[-2] if len(deps) > 1 else NO_HEAD
+        key = (2, s0, h, s0l0, s0l1, s0r0, s0r1, len(left), len(right))
+    else:
+        h = s0l0 = s0r0 = NO_HEAD
+        key = (2, s0, h, h, h, h, h, 0, 0)
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = _s0_group(table, *key[1:])
+    features.update(group)
+
+    if n0 != NO_HEAD:
+        left = config.left_deps[n0]
+        deps = left[::-1] + config.right_deps[n0]
+        n0l0 = deps[0] if deps else NO_HEAD
+        n0l1 = deps[1] if len(deps) > 1 else NO_HEAD
+        key = (3, n0, n0l0, n0l1, len(left))
+    else:
+        n0l0 = NO_HEAD
+        key = (3, n0, n0l0, n0l0, 0)
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = _n0_group(table, *key[1:])
+    features.update(group)
+
+    s0w, s0p, n0w, n0p = W[s0], P[s0], W[n0], P[n0]
+    s0wp = s0w + ';' + s0p
+    n0wp = n0w + ';' + n0p
+    features['s0wpn0wp=' + s0wp + ';' + n0wp] = 1
+    features['s0wpn0w=' + s0wp + ';' + n0w] = 1
+    features['s0wn0wp=' + s0w + ';' + n0wp] = 1
+    features['s0wpn0p=' + s0wp + ';' + n0p] = 1
+    features['s0pn0wp=' + s0p + ';' + n0wp] = 1
+    features['s0wn0w=' + s0w + ';' + n0w] = 1
+    features['s0pn0p=' + s0p + ';' + n0p] = 1
+    features['s0pn0pn1p  =' + s0p + ';' + n0p + ';' + P[n1]] = 1
+    features['s0hps0pn0p =' + P[h] + ';' + s0p + ';' + n0p] = 1
+    features['s0ps0lpn0p =' + s0p + ';' + P[s0l0] + ';' + n0p] = 1
+    features['s0ps0rpn0p =' + s0p + ';' + P[s0r0] + ';' + n0p] = 1
+    features['s0pn0pn0lp =' + s0p + ';' + n0p + ';' + P[n0l0]] = 1
+    return features
+
+
+def hashed(fex, n_buckets):
+    '''
+    wrap a feature extractor so that it returns an int array of feature
+    ids in [0, n_buckets) instead of a dict of feature strings
+    features are assumed binary, as baseline and rich emit them
+    '''
+    def extract(config):
+        features = fex(config)
+        return np.fromiter((hash(f) % n_buckets for f in features),
+                           dtype=np.intp, count=len(features))
+    return extract
@@ -1,5 +1,11 @@
 import math
-import networkx as nx
+import sys
+import numpy as np
+import decoders
+import util
+
+# networkx is imported by the functions that build graphs, so that the
+# sparse parser below (EdgeFeatures, iterEdgeFeatures) runs without it
 
 # look for "TODO" in this file to see what you should do.
 #
@@ -35,26 +41,30 @@ class Weights(dict):
 
 # now, let's define a simple test graph that we can use as an example
 # for parsing
-testGraph = nx.Graph()
-testGraph.add_node(0, {'word': '*root*',   'pos': '*root*'})
-testGraph.add_node(1, {'word': 'the',      'pos': 'DT'})
-testGraph.add_node(2, {'word': 'hairy',    'pos': 'JJ'})
-testGraph.add_node(3, {'word': 'monster',  'pos': 'NN'})
-testGraph.add_node(4, {'word': 'ate',      'pos': 'VB'})
-testGraph.add_node(5, {'word': 'tasty',    'pos': 'JJ'})
-testGraph.add_node(6, {'word': 'little',   'pos': 'JJ'})
-testGraph.add_node(7, {'word': 'children', 'pos': 'NN'})
-testGraph.add_edge(1, 3, {})   # the -> monster
-testGraph.add_edge(2, 3, {})   # hairy -> monster
-testGraph.add_edge(3, 4, {})   # monster -> ate
-testGraph.add_edge(4, 0, {})   # ate -> root
-testGraph.add_edge(5, 7, {})   # tasty -> children
-testGraph.add_edge(6, 7, {})   # little -> children
-testGraph.add_edge(7, 4, {})   # children -> ate
+def makeTestGraph():
+    import networkx as nx
+    testGraph = nx.Graph()
+    testGraph.add_node(0, {'word': '*root*',   'pos': '*root*'})
+    testGraph.add_node(1, {'word': 'the',      'pos': 'DT'})
+    testGraph.add_node(2, {'word': 'hairy',    'pos': 'JJ'})
+    testGraph.add_node(3, {'word': 'monster',  'pos': 'NN'})
+    testGraph.add_node(4, {'word': 'ate',      'pos': 'VB'})
+    testGraph.add_node(5, {'word': 'tasty',    'pos': 'JJ'})
+    testGraph.add_node(6, {'word': 'little',   'pos': 'JJ'})
+    testGraph.add_node(7, {'word': 'children', 'pos': 'NN'})
+    testGraph.add_edge(1, 3, {})   # the -> monster
+    testGraph.add_edge(2, 3, {})   # hairy -> monster
+    testGraph.add_edge(3, 4, {})   # monster -> ate
+    testGraph.add_edge(4, 0, {})   # ate -> root
+    testGraph.add_edge(5, 7, {})   # tasty -> children
+    testGraph.add_edge(6, 7, {})   # little -> children
+    testGraph.add_edge(7, 4, {})   # children -> ate
+    return testGraph
 
 # we need a function that will take a sentences, compute a fully
 # connected graph, and put features on edges
 def computeFullGraph(inputGraph):
+    import networkx as nx
     # create a new graph to return
     out = nx.Graph()
 
@@ -74,7 +84,7 @@ def computeFullGraph(inputGraph):
     return out
 
 # we can see what this is doing with:
-#   >>> computeWeightedGraph(testGraph)[0][5]
+#   >>> computeWeightedGraph(makeTestGraph())[0][5]
 #   {'w_pair=*root*_tasty': 1.0, 'p_pair=*root*_JJ': 1.0, 'dist=5': 1.0, 'weight': 0.0}
 
 
@@ -95,6 +105,7 @@ def predictWeightedGraph(graph):
     # need to negate all the edge weights because we want maximum
     # spanning tree but only have a library call for
     # minimum_spanning_tree
+    import networkx as nx
     for i,j in graph.edges_iter():
         graph[i][j]['weight'] = - graph[i][j]['weight']
     mst = nx.minimum_spanning_tree(graph)    # gotta love libraries :0
@@ -103,6 +114,27 @@ def predictWeightedGraph(graph):
         graph[i][j]['weight'] = - graph[i][j]['weight']
     return mst
 
+# the graph's edge weights as an (n+1)x(n+1) score matrix, where
+# scores[h][d] is the score of h being the head of d. our features are
+# undirected, so the matrix is symmetric
+def scoreMatrix(graph):
+    n = graph.number_of_nodes()
+    scores = np.zeros((n, n))
+    for i,j in graph.edges_iter():
+        scores[i,j] = scores[j,i] = graph[i][j]['weight']
+    return scores
+
+# predict with one of the directed decoders in decoders.py instead of
+# networkx, returning the tree as a graph just like predictWeightedGraph
+def predictDirectedTree(graph, decoder=decoders.chu_liu_edmonds):
+    import networkx as nx
+    heads = decoder(scoreMatrix(graph))
+    tree = nx.Graph()
+    tree.add_nodes_from(graph.nodes())
+    for d in range(1, len(heads)):
+        tree.add_edge(int(heads[d]), d)
+    return tree
+
 # compute number of mistakes
 def numMistakes(true, pred):
     err = 0.
@@ -128,13 +160,18 @@ def perceptronUpdate(weights, G, true, pred):
     
 # now we can finally put it all together to make a single update on a
 # single example
-def runOneExample(weights, trueGraph, quiet=False):
+# decoder is None for the networkx spanning tree, or one of the
+# decoders in decoders.py (eg decoders.chu_liu_edmonds)
+def runOneExample(weights, trueGraph, quiet=False, decoder=None):
     # first, compute the full graph and compute edge weights
     G = computeFullGraph(trueGraph)
     computeGraphEdgeWeights(G, weights)
 
     # make a prediction
-    predGraph = predictWeightedGraph(G)
+    if decoder is None:
+        predGraph = predictWeightedGraph(G)
+    else:
+        predGraph = predictDirectedTree(G, decoder)
 
     # compute the error
     err = numMistakes(trueGraph, predGraph)
@@ -154,6 +191,7 @@ def runOneExample(weights, trueGraph, quiet=False):
 
 # we can run this with:
 # >>> weights = Weights()
+# >>> testGraph = makeTestGraph()
 # >>> runOneExample(weights, testGraph)
 # error = 6.0 	pred = ( *root* <-> the ) ( *root* <-> hairy ) ( *root* <-> monster ) ( *root* <-> ate ) ( *root* <-> tasty ) ( *root* <-> little ) ( *root* <-> children ) 
 # >>> runOneExample(weights, testGraph)
@@ -185,7 +223,104 @@ def runOneExample(weights, trueGraph, quiet=False):
 # keep dropping. this is on a small subset of the overall data, but
 # perhaps you can make better features that will help!!!
 
+# computeFullGraph and computeGraphEdgeWeights redo all their work,
+# one dict operation per feature, every time we see a sentence. for
+# larger treebanks it pays to extract the features once: EdgeFeatures
+# hashes the same features of every edge (i,j), i<j, into nBuckets and
+# stores them as the rows of a sparse CSR matrix (indptr, indices,
+# data), so that scoring all edges is one sparse matrix-vector product
+# and an update only touches the rows of the wrong edges
+# words and tags are those of nodes 0..n-1, node 0 being the root, and
+# edges are the (head, dependent) pairs of the true tree
+class EdgeFeatures(object):
+    def __init__(self, words, tags, edges, nBuckets=2**20):
+        self.n = len(words)
+        self.I, self.J = np.triu_indices(self.n, 1)
+        # edgeId[i,j] is the row of edge (i,j), in either direction
+        self.edgeId = np.zeros((self.n, self.n), dtype=np.intp)
+        self.edgeId[self.I, self.J] = np.arange(len(self.I))
+        self.edgeId[self.J, self.I] = np.arange(len(self.I))
+
+        indptr = [0]
+        indices = []
+        for i, j in zip(self.I.tolist(), self.J.tolist()):
+            for feat in ('w_pair=' + words[i] + '_' + words[j],
+                         'p_pair=' + tags[i] + '_' + tags[j],
+                         'dist=' + str(abs(i-j))):
+                indices.append(hash(feat) % nBuckets)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.intp)
+        self.indices = np.array(indices, dtype=np.intp)
+        self.data = np.ones(len(indices))
+
+        # the rows of the true tree's edges
+        self.trueEdges = np.unique([self.edgeId[i,j] for i,j in edges])
+
+    # one score per edge: the sparse product of our rows with weights
+    def scores(self, weights):
+        return np.add.reduceat(weights[self.indices] * self.data, self.indptr[:-1])
+
+    # the same scores as scoreMatrix(G) after computeGraphEdgeWeights
+    def scoreMatrix(self, weights):
+        edgeScores = self.scores(weights)
+        scores = np.zeros((self.n, self.n))
+        scores[self.I, self.J] = edgeScores
+        scores[self.J, self.I] = edgeScores
+        return scores
+
+    # the rows of the edges (heads[d], d) of a decoded tree
+    def treeEdges(self, heads):
+        return np.unique(self.edgeId[heads[1:], np.arange(1, self.n)])
+
+    # add y times the rows of the given edges to weights
+    def update(self, weights, edges, y):
+        if len(edges) == 0:
+            return
+        starts = self.indptr[edges]
+        lengths = self.indptr[edges + 1] - starts
+        # positions starts[k] .. starts[k] + lengths[k] - 1 for every k
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1]) + np.repeat(starts - ends + lengths, lengths)
+        np.add.at(weights, self.indices[positions], y * self.data[positions])
+
+# the EdgeFeatures of a graph read by iterCoNLL
+def graphEdgeFeatures(inputGraph, nBuckets=2**20):
+    nodes = sorted(inputGraph.nodes())
+    return EdgeFeatures([inputGraph.node[i]['word'] for i in nodes],
+                        [inputGraph.node[i]['pos'] for i in nodes],
+                        inputGraph.edges_iter(), nBuckets)
+
+# the EdgeFeatures of every sentence of a CoNLL file, with the same
+# words and tags as iterCoNLL but read by util, without networkx
+def iterEdgeFeatures(filename, nBuckets=2**20):
+    for sentence in util.iter_conll_data(filename):
+        words = ['*root*'] + [word[4] for word in sentence]
+        tags = ['*root*'] + [word[5] for word in sentence]
+        edges = [(word[2] + 1, d + 1) for d, word in enumerate(sentence)]
+        yield EdgeFeatures(words, tags, edges, nBuckets)
+
+# the wrong and the missed edges of the tree a decoder predicts
+def sparseMistakes(weights, example, decoder=decoders.chu_liu_edmonds):
+    predEdges = example.treeEdges(decoder(example.scoreMatrix(weights)))
+    return (np.setdiff1d(predEdges, example.trueEdges),
+            np.setdiff1d(example.trueEdges, predEdges))
+
+# runOneExample for EdgeFeatures, where weights is a numpy array of
+# nBuckets floats and the tree comes from a decoder in decoders.py
+def runOneExampleSparse(weights, example, decoder=decoders.chu_liu_edmonds):
+    wrong, missed = sparseMistakes(weights, example, decoder)
+    example.update(weights, wrong, -1)
+    example.update(weights, missed, 1)
+    return float(len(wrong))
+
+# with it, training looks like:
+# >>> weights = np.zeros(2**20)
+# >>> examples = list(iterEdgeFeatures('en.tr100'))
+# >>> for iteration in range(5):
+# ...     print sum(runOneExampleSparse(weights, ex) for ex in examples)
+
 def iterCoNLL(filename):
+    import networkx as nx
     h = open(filename, 'r')
     G = None
     nn = 0
@@ -216,10 +351,13 @@ def iterCoNLL(filename):
 
 
 if __name__=="__main__":
+    # python graphparser.py [cle|eisner] to decode with decoders.py
+    # instead of the networkx spanning tree
+    decoder = decoders.DECODERS[sys.argv[1]] if len(sys.argv) > 1 else None
     weights = Weights()
     
     for iteration in range(5):
         totalErr = 0.
         for G in iterCoNLL('en.tr100'): 
-            totalErr += runOneExample(weights, G, quiet=True)
+            totalErr += runOneExample(weights, G, quiet=True, decoder=decoder)
         print totalErr
@@ -1,58 +1,442 @@
+import os
+import json
 import random
+import heapq
 import functools
-from collections import defaultdict
+from collections import Counter, defaultdict
 from multiprocessing import Pool
+import numpy as np
+import feature_extractor as fx
 
 random.seed(543)
 
+# set while SimpleParser.worker_pool forks its workers, so that they read
+# the parser from the parent's memory instead of a pickled copy. the
+# sentences are sent with every task, so that one pool serves a stream
+_worker_parser = None
+
+
+def _predict_chunk(task):
+    chunk, sentences = task
+    return chunk, _worker_parser.predict_batch(sentences)
+
+
+def load_parser(path, arcsys, fex, oracle):
+    '''
+    load a model written by SimpleParser.save, as a SimpleParser or
+    HashedParser depending on how it was trained. the weights are
+    memory-mapped copy-on-write, so processes parsing with the same
+    model share one physical copy of it
+    '''
+    with open(os.path.join(path, 'model.json')) as f:
+        meta = json.load(f)
+    if meta['transitions'] != list(arcsys.TRANSITION_NAMES):
+        raise ValueError('model was trained for transitions %s' % meta['transitions'])
+    weights = np.load(os.path.join(path, 'weights.npy'), mmap_mode='c')
+    if meta['parser'] == 'HashedParser':
+        parser = HashedParser(arcsys, fex, oracle, meta['n_rows'])
+    else:
+        parser = SimpleParser(arcsys, fex, oracle)
+        with open(os.path.join(path, 'features')) as f:
+            features = f.read().split('\n') if meta['n_rows'] > 0 else []
+        parser.features = features
+        parser.index = dict(zip(features, xrange(len(features))))
+    parser.n_rows = meta['n_rows']
+    parser.weights = weights
+    # zeros are allocated lazily by the OS, so these cost nothing
+    # unless training continues from the loaded weights
+    parser.previous_update = np.zeros(weights.shape)
+    parser.weight_accumulate = np.zeros(weights.shape)
+    return parser
+
+
+def load_checkpoint(path, arcsys, fex, oracle):
+    '''
+    the parser in the last checkpoint written by SimpleParser.checkpoint
+    to the directory path, with its raw weights and averaging state, and
+    the training state that was saved with it
+    '''
+    with open(os.path.join(path, 'checkpoint.json')) as f:
+        meta = json.load(f)
+    if meta['transitions'] != list(arcsys.TRANSITION_NAMES):
+        raise ValueError('checkpoint was trained for transitions %s' % meta['transitions'])
+    if meta['parser'] == 'HashedParser':
+        parser = HashedParser(arcsys, fex, oracle, meta['n_rows'])
+    else:
+        parser = SimpleParser(arcsys, fex, oracle)
+        with open(os.path.join(path, 'features')) as f:
+            # lines past n_features are left over from an unfinished checkpoint
+            features = f.read().split('\n')[:meta['n_features']]
+        parser.features = features
+        parser.index = dict(zip(features, xrange(len(features))))
+        shape = (max(meta['n_rows'], parser.INITIAL_ROWS), len(arcsys.TRANSITIONS))
+        parser.weights = np.zeros(shape)
+        parser.previous_update = np.zeros(shape)
+        parser.weight_accumulate = np.zeros(shape)
+    parser.n_rows = meta['n_rows']
+    parser.current_update = meta['current_update']
+    parser.exploring = meta['exploring']
+    parser.frozen = meta.get('frozen', False)
+    for name in meta['deltas']:
+        delta = np.load(os.path.join(path, name))
+        rows = delta['rows']
+        parser.weights[rows] = delta['weights']
+        parser.previous_update[rows] = delta['previous_update']
+        parser.weight_accumulate[rows] = delta['weight_accumulate']
+    order = np.load(os.path.join(path, meta['deltas'][-1]))['order'].tolist()
+    rng = meta['rng']
+    state = {'epoch': meta['epoch'], 'order': order,
+             'rng': (rng[0], tuple(rng[1]), rng[2])}
+    return parser, state
+
+
+class Replay(object):
+    '''
+    a sentence's static-oracle training path: for every step, the feature
+    ids (ids[offsets[i]:offsets[i + 1]]), the legal transitions as a
+    bitmask and the oracle transition
+    '''
+
+    __slots__ = ('ids', 'offsets', 'legal', 'gold')
+
+    def __init__(self, ids, offsets, legal, gold):
+        self.ids = ids
+        self.offsets = offsets
+        self.legal = legal
+        self.gold = gold
+
+
+def balanced_chunks(sentences, n_chunks):
+    '''
+    split sentence indices into n_chunks groups of similar total length,
+    assigning the longest sentences first to the lightest group
+    '''
+    heap = [(0, c, []) for c in xrange(n_chunks)]
+    for i in sorted(xrange(len(sentences)), key=lambda i: -len(sentences[i])):
+        load, c, chunk = heapq.heappop(heap)
+        chunk.append(i)
+        heapq.heappush(heap, (load + len(sentences[i]), c, chunk))
+    return [sorted(chunk) for _, _, chunk in sorted(heap, key=lambda h: h[1]) if chunk]
+
+
+_add = np.add.reduce
+
+
+def _flat(array):
+    '''
+    a flat view of a contiguous array; raises rather than copying
+    '''
+    flat = array.view()
+    flat.shape = (-1,)
+    return flat
+
+
 class SimpleParser:
+    '''
+    averaged perceptron over a growing feature index: feature i owns row i
+    of the weights and of the two arrays of the lazy averaging state
+    '''
+
+    INITIAL_ROWS = 1024
+    PARALLEL_MIN_SENTENCES = 64
 
     def __init__(self, arcsys, fex, oracle):
-        self.weights = dict()
+        self.index = dict()
+        self.features = []
+        self.n_rows = 0
+        shape = (self.INITIAL_ROWS, len(arcsys.TRANSITIONS))
+        self.weights = np.zeros(shape)
         self.arcsys = arcsys
         self.fex = fex
         self.oracle = oracle
         self.exploring = False
         self.EXPLORE_P = 0.9
         self.current_update = 0
-        self.previous_update = defaultdict(lambda: 0)
-        self.weight_accumulate = defaultdict(lambda: 0)
+        self.previous_update = np.zeros(shape)
+        self.weight_accumulate = np.zeros(shape)
+        self.beam_width = 1
+        # once pruned, the index is fixed and unknown features are skipped
+        self.frozen = False
+
+    def add_feature(self, feature):
+        '''
+        row of the given feature, allocating one if it is new
+        '''
+        row = self.index.get(feature)
+        if row is None:
+            row = self.n_rows
+            if row == len(self.weights):
+                self.weights = self._grow(self.weights, row + 1)
+                self.previous_update = self._grow(self.previous_update, row + 1)
+                self.weight_accumulate = self._grow(self.weight_accumulate, row + 1)
+            self.index[feature] = row
+            self.features.append(feature)
+            self.n_rows += 1
+        return row
+
+    @staticmethod
+    def _grow(array, needed):
+        # doubling alone would keep an empty array (a loaded model with
+        # no features) empty forever
+        grown = np.zeros((max(needed, 2 * len(array)), array.shape[1]))
+        grown[:len(array)] = array
+        return grown
+
+    def feature_rows(self, features):
+        '''
+        rows and values of the known features, unknown ones are skipped
+        '''
+        index = self.index
+        known = [(index[f], v) for f, v in features.iteritems() if f in index]
+        if len(known) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+        rows, values = zip(*known)
+        return np.array(rows, dtype=np.intp), np.array(values, dtype=float)
+
+    def update_rows(self, features):
+        '''
+        rows and values of all the features, adding the unknown ones
+        (or skipping them, if the index is frozen)
+        '''
+        if self.frozen:
+            return self.feature_rows(features)
+        rows = np.array([self.add_feature(f) for f in features], dtype=np.intp)
+        return rows, np.array(features.values(), dtype=float)
+
+    def compact(self):
+        '''
+        drop the features whose weights are all zero, e.g. those kept by
+        prune that training never updated. only for finished (averaged)
+        models, the averaging state is dropped as well
+        '''
+        keep = np.flatnonzero(self.weights[:self.n_rows].any(axis=1))
+        self.features = [self.features[row] for row in keep]
+        self.index = dict(zip(self.features, xrange(len(self.features))))
+        self.weights = self.weights[keep]
+        self.n_rows = len(keep)
+        self.previous_update = np.zeros(self.weights.shape)
+        self.weight_accumulate = np.zeros(self.weights.shape)
+
+    def count_features(self, sentences, gold_configs):
+        '''
+        how often every feature occurs in the configurations along the
+        oracle paths of the given sentences
+        '''
+        counts = Counter()
+        for sentence, gold_config in zip(sentences, gold_configs):
+            config = self.arcsys.get_initial_config(sentence)
+            while not self.arcsys.is_finished(config):
+                if len(self.arcsys.get_legal_transitions(config)) == 0:
+                    break
+                counts.update(self.fex(config).iterkeys())
+                transition = self.oracle(config, gold_config)[0]
+                config = self.arcsys.take_transition(config, transition)
+        return counts
+
+    def prune(self, counts, cutoff, template_cutoffs=None):
+        '''
+        restrict the model to the features counted at least cutoff times
+        (or template_cutoffs[template] times, the template being the part
+        of the feature before '='), and freeze the index so that training
+        skips all others. returns the number of features kept
+        '''
+        template_cutoffs = template_cutoffs or {}
+        for feature in sorted(counts):
+            template = feature.split('=', 1)[0]
+            if counts[feature] >= template_cutoffs.get(template, cutoff):
+                self.add_feature(feature)
+        self.frozen = True
+        return self.n_rows
+
+    def keys_to_rows(self, keys):
+        return np.array([self.add_feature(f) for f in keys], dtype=np.intp)
+
+    def rows_to_keys(self, rows):
+        return [self.features[row] for row in rows]
 
     def score(self, features):
-        scores = dict((label, 0) for label in self.arcsys.TRANSITIONS)
-        for feature, value in features.items():
-            if feature not in self.weights:
-                continue
-            for transition, weight in self.weights[feature].items():
-                scores[transition] += weight * value
+        values = features.values()
+        if values.count(1) == len(values):
+            # binary features, as baseline and rich emit them: a plain
+            # sum of rows, without building value arrays. for small
+            # feature sets these conversions cost more than the sum, so
+            # the ndarray methods and ufunc are called directly, and the
+            # scores are returned as floats, which max() compares faster
+            index = self.index
+            rows = [index[f] for f in features if f in index]
+            return _add(self.weights.take(rows, 0), 0).tolist()
+        rows, values = self.feature_rows(features)
+        return (self.weights[rows] * values[:, None]).sum(axis=0)
+
+    def score_batch(self, features_batch):
+        if len(features_batch) == 0:
+            return []
+        looked_up = [self.feature_rows(features) for features in features_batch]
+        lengths = np.array([len(rows) for rows, _ in looked_up])
+        rows = np.concatenate([rows for rows, _ in looked_up])
+        values = np.concatenate([values for _, values in looked_up])
+        # a trailing zero row keeps every reduceat offset in range, and
+        # segments without known features are zeroed after the fact
+        weighted = np.vstack([self.weights[rows] * values[:, None],
+                              np.zeros((1, self.weights.shape[1]))])
+        offsets = np.cumsum(lengths) - lengths
+        scores = np.add.reduceat(weighted, offsets, axis=0)
+        scores[lengths == 0] = 0
         return scores
 
     def average_weights(self):
-        for feature in self.weights:
-            for label in self.weights[feature]:
-                total = self.weight_accumulate[(feature, label)]
-                t_delta = self.current_update - self.previous_update[(feature, label)]
-                total += t_delta * self.weights[feature][label]
-                avg = total / float(self.current_update)
-                self.weights[feature][label] = avg
-
-    def update_weights(self, label, pair):
-        feature, value = pair
-        if feature not in self.weights:
-            self.weights[feature] = {}
-        if label not in self.weights[feature]:
-            self.weights[feature][label] = 0
-        weight = self.weights[feature][label]
-        t_delta = self.current_update - self.previous_update[(feature, label)]
-        self.weight_accumulate[(feature, label)] += t_delta * weight
-        self.previous_update[(feature, label)] = self.current_update
-        self.weights[feature][label] += value
+        if self.current_update == 0:
+            # no updates: the average is the weights themselves
+            return
+        n = self.n_rows
+        t_delta = self.current_update - self.previous_update[:n]
+        total = self.weight_accumulate[:n] + t_delta * self.weights[:n]
+        self.weights[:n] = total / float(self.current_update)
+
+    def update_weights(self, true_label, pred_label, rows, values):
+        '''
+        add values to the rows' weights for true_label and subtract them
+        for pred_label. rows are distinct, so both columns are updated
+        in one pass over flat views, which is much cheaper than indexing
+        rows and columns when there are only a few features
+        '''
+        base = rows * self.weights.shape[1]
+        cells = np.concatenate([base + true_label, base + pred_label])
+        weights = _flat(self.weights)
+        previous_update = _flat(self.previous_update)
+        old = weights.take(cells)
+        _flat(self.weight_accumulate)[cells] += (self.current_update
+                                                 - previous_update.take(cells)) * old
+        previous_update[cells] = self.current_update
+        weights[cells] = old + np.concatenate([values, -values])
+
+    def reset_averaging(self):
+        '''
+        restart the averaging clock, keeping the current weights
+        '''
+        self.current_update = 0
+        self.previous_update = np.zeros(self.weights.shape)
+        self.weight_accumulate = np.zeros(self.weights.shape)
+
+    def shard_state(self):
+        '''
+        after reset_averaging and training on one shard: the number of
+        updates and, for every feature touched, its key, its weights and
+        the sum of its weights over those updates
+        '''
+        n = self.n_rows
+        rows = np.flatnonzero(self.previous_update[:n].any(axis=1))
+        weights = self.weights[rows]
+        t_delta = self.current_update - self.previous_update[rows]
+        totals = self.weight_accumulate[rows] + t_delta * weights
+        return self.current_update, (self.rows_to_keys(rows), weights, totals)
+
+    def mix(self, states):
+        '''
+        iterative parameter mixing: replace the weights with the uniform
+        average of the shards' weights (given as shard_state()s) and
+        advance the averaging state by the average shard, as if its
+        updates had been made here
+        '''
+        shards = [(updates, self.keys_to_rows(keys), weights, totals)
+                  for updates, (keys, weights, totals) in states]
+        k = len(shards)
+        n = self.n_rows
+        start = self.current_update
+        total_updates = sum(updates for updates, _, _, _ in shards)
+        end = start + total_updates / float(k)
+        weight_sum = self.weights[:n] * k
+        total_sum = self.weights[:n] * total_updates
+        for updates, rows, weights, totals in shards:
+            weight_sum[rows] += weights - self.weights[rows]
+            total_sum[rows] += totals - updates * self.weights[rows]
+        t_delta = start - self.previous_update[:n]
+        self.weight_accumulate[:n] += t_delta * self.weights[:n] + total_sum / k
+        self.previous_update[:n] = end
+        self.weights[:n] = weight_sum / k
+        self.current_update = end
+
+    def save(self, path):
+        '''
+        write the weights to the directory path: the feature index (one
+        feature per line, in row order), the weights as one contiguous
+        .npy block and a small json header. see load_parser
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta = {'parser': self.__class__.__name__,
+                'transitions': list(self.arcsys.TRANSITION_NAMES),
+                'n_rows': self.n_rows}
+        with open(os.path.join(path, 'model.json'), 'w') as f:
+            json.dump(meta, f)
+        with open(os.path.join(path, 'features'), 'w') as f:
+            f.write('\n'.join(self.features))
+        np.save(os.path.join(path, 'weights.npy'), self.weights[:self.n_rows])
+
+    def checkpoint(self, path, epoch, order, rng):
+        '''
+        add the unaveraged training state after epoch to the directory
+        path, along with the training set order and random state
+        only what changed since the last checkpoint is written: new
+        features are appended, and the rows whose averaging clock moved
+        go to a delta file per epoch. checkpoint.json is replaced last,
+        so a checkpoint interrupted halfway leaves the previous one intact
+        when every row changed, as after each mix() of a -t run, the delta
+        is a full snapshot: it replaces the earlier deltas, which are removed
+        see load_checkpoint
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, 'checkpoint.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                last = json.load(f)
+        else:
+            last = {'n_features': 0, 'features_size': 0, 'deltas': []}
+
+        with open(os.path.join(path, 'features'), 'ab') as f:
+            f.truncate(last['features_size'])
+            f.write(''.join(feature + '\n' for feature in self.features[last['n_features']:]))
+            features_size = f.tell()
+
+        n = self.n_rows
+        if last['deltas']:
+            changed = self.previous_update[:n] > last['current_update']
+        else:
+            # rows left at zero need not be written, loading starts from zeros
+            changed = ((self.weights[:n] != 0) | (self.previous_update[:n] != 0)
+                       | (self.weight_accumulate[:n] != 0))
+        rows = np.flatnonzero(changed.any(axis=1))
+        full = len(rows) == n
+        name = 'delta-%04d.npz' % epoch
+        with open(os.path.join(path, name + '.tmp'), 'wb') as f:
+            np.savez(f, rows=rows, weights=self.weights[rows],
+                     previous_update=self.previous_update[rows],
+                     weight_accumulate=self.weight_accumulate[rows],
+                     order=np.array(order, dtype=np.int64))
+        os.rename(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+
+        meta = {'parser': self.__class__.__name__,
+                'transitions': list(self.arcsys.TRANSITION_NAMES),
+                'n_rows': n,
+                'n_features': len(self.features),
+                'features_size': features_size,
+                'current_update': self.current_update,
+                'exploring': self.exploring,
+                'frozen': self.frozen,
+                'epoch': epoch,
+                'rng': rng,
+                'deltas': [d for d in last['deltas'] if d != name and not full] + [name]}
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.rename(meta_path + '.tmp', meta_path)
+        for stale in set(last['deltas']) - set(meta['deltas']):
+            os.remove(os.path.join(path, stale))
 
     def update(self, true_label, pred_label, features):
         self.current_update += 1
-        for feature, value in features.items():
-            self.update_weights(true_label, (feature, value))
-            self.update_weights(pred_label, (feature, -value))
+        rows, values = self.update_rows(features)
+        self.update_weights(true_label, pred_label, rows, values)
 
     def train(self, sentence, gold_config):
         config = self.arcsys.get_initial_config(sentence)
@@ -79,6 +463,71 @@ class SimpleParser:
             total += 1
         return total, correct
     
+    def feature_ids(self, features):
+        '''
+        ids under which a replay stores the features: their rows,
+        registering the new ones
+        '''
+        if self.frozen:
+            return np.array([self.index[f] for f in features if f in self.index],
+                            dtype=np.int32)
+        return np.array([self.add_feature(f) for f in features], dtype=np.int32)
+
+    def replay_update_rows(self, ids):
+        return ids, np.ones(len(ids))
+
+    def record(self, sentence, gold_config):
+        '''
+        the Replay of train() on this sentence, which is the same in every
+        epoch as long as the oracle has a single zero-cost transition and
+        there is no exploration. features are taken to be binary
+        '''
+        config = self.arcsys.get_initial_config(sentence)
+        ids = []
+        offsets = [0]
+        legal = []
+        gold = []
+        while not self.arcsys.is_finished(config):
+            legal_transitions = self.arcsys.get_legal_transitions(config)
+            if len(legal_transitions) == 0:
+                break
+            features = self.feature_ids(self.fex(config))
+            zero_transitions = self.oracle(config, gold_config)
+            if len(zero_transitions) != 1:
+                raise ValueError('replay needs an oracle with a single '
+                                 'zero-cost transition per configuration')
+            ids.append(features)
+            offsets.append(offsets[-1] + len(features))
+            legal.append(sum(1 << t for t in legal_transitions))
+            gold.append(zero_transitions[0])
+            config = self.arcsys.take_transition(config, zero_transitions[0])
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int32)
+        return Replay(ids.astype(np.int32), np.array(offsets, dtype=np.int32),
+                      np.array(legal, dtype=np.uint8), np.array(gold, dtype=np.uint8))
+
+    def train_replay(self, replay):
+        '''
+        train() on a recorded sentence: only scoring and updates are run
+        '''
+        legal_of = [[t for t in self.arcsys.TRANSITIONS if mask & (1 << t)]
+                    for mask in xrange(1 << len(self.arcsys.TRANSITIONS))]
+        offsets = replay.offsets.tolist()
+        total = 0
+        correct = 0
+        for step, (legal, true_transition) in enumerate(zip(replay.legal.tolist(),
+                                                            replay.gold.tolist())):
+            ids = replay.ids[offsets[step]:offsets[step + 1]]
+            scores = self.weights[ids].sum(axis=0)
+            pred_transition = max(legal_of[legal], key=lambda p: scores[p])
+            if pred_transition != true_transition:
+                self.current_update += 1
+                rows, values = self.replay_update_rows(ids)
+                self.update_weights(true_transition, pred_transition, rows, values)
+            else:
+                correct += 1
+            total += 1
+        return total, correct
+
     def explore(self, config, true_transition, pred_transition):
         if random.random() < self.EXPLORE_P:
             return self.arcsys.take_transition(config, pred_transition)
@@ -86,6 +535,14 @@ class SimpleParser:
             return self.arcsys.take_transition(config, true_transition)
     
     def predict(self, sentence):
+        if self.beam_width > 1:
+            return self.decode_beam(sentence).arcs
+        return self.decode(sentence).arcs
+
+    def decode(self, sentence):
+        '''
+        the configuration greedy decoding ends in
+        '''
         config = self.arcsys.get_initial_config(sentence)
         while not self.arcsys.is_finished(config):
             legal_transitions = self.arcsys.get_legal_transitions(config)
@@ -95,4 +552,178 @@ class SimpleParser:
             scores = self.score(features)
             pred_transition = max(legal_transitions, key=lambda p: scores[p])
             config = self.arcsys.take_transition(config, pred_transition)
-        return config.arcs
+        return config
+
+    def decode_beam(self, sentence):
+        '''
+        the configuration beam search over transition sequences ends in,
+        keeping the beam_width highest scoring configurations (sum of
+        transition scores) per step
+        finished configurations are carried over as is, and configurations
+        that are stuck before finishing are dropped. the best finished one
+        wins; if none finishes, the sentence is decoded greedily instead
+        '''
+        beam = [(0.0, self.arcsys.get_initial_config(sentence))]
+        while True:
+            candidates = []
+            for total, config in beam:
+                if self.arcsys.is_finished(config):
+                    candidates.append((total, config, None))
+                    continue
+                legal_transitions = self.arcsys.get_legal_transitions(config)
+                if len(legal_transitions) == 0:
+                    continue
+                scores = self.score(self.fex(config))
+                for transition in legal_transitions:
+                    candidates.append((total + scores[transition], config, transition))
+            if all(t is None for _, _, t in candidates):
+                break
+            # nlargest is stable, so ties go to the earlier candidate
+            # the same way max() breaks them in greedy decoding
+            candidates = heapq.nlargest(self.beam_width, candidates,
+                                        key=lambda c: c[0])
+            uses = defaultdict(lambda: 0)
+            for _, config, transition in candidates:
+                if transition is not None:
+                    uses[id(config)] += 1
+            beam = []
+            for total, config, transition in candidates:
+                if transition is not None:
+                    # copy only while another candidate still needs the parent
+                    uses[id(config)] -= 1
+                    if uses[id(config)] > 0:
+                        config = config.copy()
+                    config = self.arcsys.take_transition(config, transition)
+                beam.append((total, config))
+        if len(candidates) == 0:
+            return self.decode(sentence)
+        return max(candidates, key=lambda c: c[0])[1]
+
+    def predict_batch(self, sentences, batch_size=256):
+        '''
+        greedy decoding of many sentences in lockstep: every step takes
+        one transition in each unfinished configuration, scoring all of
+        them with one score_batch call. sentences are grouped by length
+        so that batches finish together; arcs come back in input order
+        '''
+        if self.beam_width > 1:
+            return [self.predict(sentence) for sentence in sentences]
+        order = sorted(xrange(len(sentences)), key=lambda i: len(sentences[i]))
+        results = [None] * len(sentences)
+        for start in xrange(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            configs = [self.arcsys.get_initial_config(sentences[i]) for i in batch]
+            active = range(len(batch))
+            while len(active) > 0:
+                stepping = []
+                legal_batch = []
+                for j in active:
+                    if self.arcsys.is_finished(configs[j]):
+                        continue
+                    legal_transitions = self.arcsys.get_legal_transitions(configs[j])
+                    if len(legal_transitions) == 0:
+                        continue
+                    stepping.append(j)
+                    legal_batch.append(legal_transitions)
+                features_batch = [self.fex(configs[j]) for j in stepping]
+                scores_batch = self.score_batch(features_batch)
+                for j, legal_transitions, scores in zip(stepping, legal_batch, scores_batch):
+                    pred_transition = max(legal_transitions, key=lambda p: scores[p])
+                    configs[j] = self.arcsys.take_transition(configs[j], pred_transition)
+                active = stepping
+            for i, config in zip(batch, configs):
+                results[i] = config.arcs
+        return results
+
+    def worker_pool(self, workers):
+        '''
+        a Pool of workers forked with this parser's (averaged) weights, to
+        be passed to predict_parallel for every chunk of a stream. the
+        caller closes it
+        '''
+        global _worker_parser
+        _worker_parser = self
+        try:
+            return Pool(workers)
+        finally:
+            _worker_parser = None
+
+    def predict_parallel(self, sentences, workers=1, pool=None):
+        '''
+        predict_batch spread over workers processes, those of pool if
+        given (see worker_pool), else of a pool forked for this call
+        fewer than PARALLEL_MIN_SENTENCES are parsed in this process,
+        where they cost less than sending them to the workers
+        arcs come back in input order
+        '''
+        if workers <= 1 or len(sentences) < self.PARALLEL_MIN_SENTENCES:
+            return self.predict_batch(sentences)
+        own_pool = pool is None
+        if own_pool:
+            pool = self.worker_pool(workers)
+        try:
+            results = [None] * len(sentences)
+            tasks = [(chunk, [sentences[i] for i in chunk])
+                     for chunk in balanced_chunks(sentences, workers * 4)]
+            for chunk, arcs in pool.imap_unordered(_predict_chunk, tasks):
+                for i, a in zip(chunk, arcs):
+                    results[i] = a
+        finally:
+            if own_pool:
+                pool.close()
+                pool.join()
+        return results
+
+
+class HashedParser(SimpleParser):
+    '''
+    SimpleParser over hashed feature ids: every bucket of the hash space
+    owns a row up front, and features are an int array of row ids
+    '''
+
+    def __init__(self, arcsys, fex, oracle, n_buckets=2 ** 20):
+        SimpleParser.__init__(self, arcsys, fx.hashed(fex, n_buckets), oracle)
+        shape = (n_buckets, len(arcsys.TRANSITIONS))
+        self.n_rows = n_buckets
+        self.weights = np.zeros(shape)
+        self.previous_update = np.zeros(shape)
+        self.weight_accumulate = np.zeros(shape)
+
+    def feature_ids(self, features):
+        return features
+
+    def count_features(self, sentences, gold_configs):
+        raise ValueError('feature pruning needs the feature index of SimpleParser')
+
+    def prune(self, counts, cutoff, template_cutoffs=None):
+        raise ValueError('feature pruning needs the feature index of SimpleParser')
+
+    def replay_update_rows(self, ids):
+        return self.update_rows(ids)
+
+    def update_rows(self, features):
+        # colliding ids within one step count as a feature of value > 1
+        rows, counts = np.unique(features, return_counts=True)
+        return rows, counts.astype(float)
+
+    def keys_to_rows(self, keys):
+        return keys
+
+    def rows_to_keys(self, rows):
+        return rows
+
+    def score(self, features):
+        return self.weights[features].sum(axis=0)
+
+    def score_batch(self, features_batch):
+        if len(features_batch) == 0:
+            return []
+        lengths = np.array([len(f) for f in features_batch])
+        ids = np.concatenate(features_batch)
+        # as in SimpleParser.score_batch: a trailing zero row keeps every
+        # offset in range, and empty segments are zeroed after the fact
+        rows = np.vstack([self.weights[ids], np.zeros((1, self.weights.shape[1]))])
+        offsets = np.cumsum(lengths) - lengths
+        scores = np.add.reduceat(rows, offsets, axis=0)
+        scores[lengths == 0] = 0
+        return scores
@@ -0,0 +1,78 @@
+import time
+
+PHASES = ['fex', 'scoring', 'legality', 'oracle', 'transitions', 'updates']
+
+
+class PhaseTimer(object):
+    '''
+    seconds and calls per phase of training and parsing, collected by
+    wrapping the hot functions of a parser (see instrument). a parser
+    that was never instrumented runs exactly the same code as before,
+    so leaving this off costs nothing
+    '''
+
+    def __init__(self):
+        self.seconds = dict((phase, 0.0) for phase in PHASES)
+        self.calls = dict((phase, 0) for phase in PHASES)
+        self.start = time.time()
+
+    def reset(self):
+        # cleared in place, the wrappers hold on to these dicts
+        for phase in PHASES:
+            self.seconds[phase] = 0.0
+            self.calls[phase] = 0
+        self.start = time.time()
+
+    def wrap(self, phase, fn):
+        seconds = self.seconds
+        calls = self.calls
+        clock = time.time
+
+        def timed(*args):
+            start = clock()
+            result = fn(*args)
+            seconds[phase] += clock() - start
+            calls[phase] += 1
+            return result
+        return timed
+
+    def snapshot(self):
+        '''
+        phases since the last reset, with the wall time they are part of
+        '''
+        return {'seconds': time.time() - self.start,
+                'phases': dict((phase, {'seconds': self.seconds[phase],
+                                        'calls': self.calls[phase]})
+                               for phase in PHASES)}
+
+    @staticmethod
+    def format(snapshot):
+        total = snapshot['seconds']
+        lines = []
+        for phase in PHASES:
+            p = snapshot['phases'][phase]
+            lines.append('  %-12s %8.3fs %5.1f%% %10d calls' % (
+                phase, p['seconds'], 100 * p['seconds'] / total if total else 0., p['calls']))
+        other = total - sum(p['seconds'] for p in snapshot['phases'].values())
+        lines.append('  %-12s %8.3fs %5.1f%%' % ('other', other,
+                                                100 * other / total if total else 0.))
+        return '\n'.join(lines)
+
+
+def instrument(parser, timer):
+    '''
+    time parser's feature extraction, scoring, oracle and updates, and the
+    legality checks and transitions of its transition system, in timer
+    the wrappers are set on the instances, so the oracle's own calls to
+    get_legal_transitions count as oracle time. replayed epochs score and
+    update inline, so they are not broken down
+    '''
+    arcsys = parser.arcsys
+    parser.fex = timer.wrap('fex', parser.fex)
+    parser.score = timer.wrap('scoring', parser.score)
+    parser.score_batch = timer.wrap('scoring', parser.score_batch)
+    parser.oracle = timer.wrap('oracle', parser.oracle)
+    parser.update = timer.wrap('updates', parser.update)
+    arcsys.get_legal_transitions = timer.wrap('legality', arcsys.get_legal_transitions)
+    arcsys.take_transition = timer.wrap('transitions', arcsys.take_transition)
+    return parser
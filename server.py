@@ -0,0 +1,331 @@
+'''
+a parse server that keeps a model loaded and parses the sentences of
+concurrent requests together, in micro-batches
+
+    python cli.py serve MODEL [--port PORT | --unix PATH]
+
+    POST /parse   CoNLL lines, or JSON {"sentences": [[[word, pos], ...], ...]}
+                  ?format=json (default) answers {"sentences": [{"heads":
+                  [...]}, ...]} with CoNLL head numbers (0 is the root, null
+                  unattached); ?format=conll answers CoNLL lines
+    GET  /stats   throughput, batch and latency counters as JSON
+
+requests wait for at most window seconds for others to join their batch,
+which is then parsed with one SimpleParser.predict_batch call in a single
+parsing thread. ParseClient talks to a server over TCP or a Unix socket
+'''
+import BaseHTTPServer
+import Queue
+import SocketServer
+import httplib
+import json
+import socket
+import threading
+import time
+import urlparse
+from collections import deque
+import numpy as np
+import util
+
+
+class Stats(object):
+    '''
+    counters of a running server, updated from the request threads and
+    the parsing thread. latencies are kept for the last max_latencies
+    requests
+    '''
+
+    def __init__(self, max_latencies=10000):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.sentences = 0
+        self.tokens = 0
+        self.batches = 0
+        self.parse_seconds = 0.0
+        self.latencies = deque(maxlen=max_latencies)
+
+    def add_batch(self, sentences, tokens, seconds):
+        with self.lock:
+            self.batches += 1
+            self.sentences += sentences
+            self.tokens += tokens
+            self.parse_seconds += seconds
+
+    def add_request(self, seconds, error=False):
+        with self.lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            else:
+                self.latencies.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.time() - self.start
+            latencies = np.array(self.latencies)
+            stats = {'uptime': uptime, 'requests': self.requests, 'errors': self.errors,
+                     'sentences': self.sentences, 'tokens': self.tokens,
+                     'batches': self.batches, 'parse_seconds': self.parse_seconds}
+        stats['sentences_per_batch'] = float(stats['sentences']) / stats['batches'] \
+            if stats['batches'] else 0.
+        stats['tokens_per_sec'] = stats['tokens'] / uptime
+        stats['parse_tokens_per_sec'] = stats['tokens'] / stats['parse_seconds'] \
+            if stats['parse_seconds'] else 0.
+        for name, q in [('p50_ms', 50), ('p99_ms', 99)]:
+            stats[name] = np.percentile(latencies, q) * 1e3 if len(latencies) else 0.
+        stats['mean_ms'] = latencies.mean() * 1e3 if len(latencies) else 0.
+        return stats
+
+
+class Batcher(object):
+    '''
+    parses the sentences of concurrent parse calls together: the first
+    request of a batch waits window seconds for more, or until the batch
+    holds max_batch sentences, and the whole batch goes through one
+    predict_batch call. only the batcher's thread touches the parser
+    '''
+
+    def __init__(self, parser, stats, window=0.005, max_batch=256):
+        self.parser = parser
+        self.stats = stats
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def parse(self, sentences):
+        '''
+        arcs of every sentence, parsed in the batcher's thread
+        '''
+        request = {'sentences': sentences, 'done': threading.Event()}
+        self.queue.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['arcs']
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        n = len(batch[0]['sentences'])
+        deadline = time.time() + self.window
+        while n < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except Queue.Empty:
+                break
+            batch.append(request)
+            n += len(request['sentences'])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            sentences = [s for request in batch for s in request['sentences']]
+            start = time.time()
+            try:
+                arcs = self.parser.predict_batch(sentences)
+            except Exception as e:
+                for request in batch:
+                    request['error'] = e
+                    request['done'].set()
+                continue
+            self.stats.add_batch(len(sentences), sum(len(s) for s in sentences),
+                                 time.time() - start)
+            i = 0
+            for request in batch:
+                n = len(request['sentences'])
+                request['arcs'] = arcs[i:i + n]
+                i += n
+                request['done'].set()
+
+
+def read_sentences(body, content_type):
+    '''
+    sentences of a request body, JSON (word, pos) pairs or CoNLL lines
+    '''
+    if content_type.startswith('application/json') or body.lstrip().startswith('{'):
+        try:
+            sentences = [util.tagged_sentence(json_tokens(tokens))
+                         for tokens in json.loads(body)['sentences']]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('expected {"sentences": [[[word, pos], ...], ...]}')
+    else:
+        try:
+            sentences = list(util.iter_conll_lines(body.splitlines()))
+        except (IndexError, ValueError):
+            raise ValueError('expected tab separated CoNLL lines')
+    sentences = [s for s in sentences if len(s) > 0]
+    if len(sentences) == 0:
+        raise ValueError('no sentences')
+    return sentences
+
+
+def json_tokens(tokens):
+    '''
+    (word, pos) pairs of a JSON sentence, as UTF-8 strings like the words
+    read from CoNLL files. TypeError unless every token is a pair of strings
+    '''
+    pairs = []
+    for token in tokens:
+        if not (isinstance(token, list) and len(token) == 2 and
+                all(isinstance(t, basestring) for t in token)):
+            raise TypeError('token %r is not a [word, pos] pair' % (token,))
+        pairs.append(tuple(t.encode('utf-8') for t in token))
+    return pairs
+
+
+def heads_of(sentence, arcs):
+    '''
+    CoNLL head numbers of a parsed sentence, None if unattached
+    '''
+    heads = [None] * len(sentence)
+    for h, d in arcs:
+        heads[d] = h + 1
+    return heads
+
+
+class ParseHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path != '/stats':
+            return self.reply(404, 'text/plain', 'not found\n')
+        self.reply(200, 'application/json', json.dumps(self.server.stats.snapshot()))
+
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != '/parse':
+            return self.reply(404, 'text/plain', 'not found\n')
+        start = time.time()
+        output = urlparse.parse_qs(url.query).get('format', ['json'])[0]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if output not in ('json', 'conll'):
+                raise ValueError('format is json or conll')
+            sentences = read_sentences(body, self.headers.get('Content-Type', ''))
+        except ValueError as e:
+            self.server.stats.add_request(time.time() - start, error=True)
+            return self.reply(400, 'text/plain', str(e) + '\n')
+        try:
+            arcs = self.server.batcher.parse(sentences)
+        except Exception as e:
+            self.server.stats.add_request(time.time() - start, error=True)
+            return self.reply(500, 'text/plain', '%s: %s\n' % (e.__class__.__name__, e))
+        if output == 'json':
+            reply = json.dumps({'sentences': [{'heads': heads_of(s, a)}
+                                              for s, a in zip(sentences, arcs)]})
+            self.reply(200, 'application/json', reply)
+        else:
+            self.reply(200, 'text/plain', ''.join(util.format_conll(s, a)
+                                                  for s, a in zip(sentences, arcs)))
+        self.server.stats.add_request(time.time() - start)
+
+    def reply(self, code, content_type, body):
+        # Content-Length counts bytes
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+
+# the default listen backlog of 5 makes bursts of clients wait for
+# connection retries, which cost a second each
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(parser, address, window=0.005, max_batch=256, verbose=False):
+    '''
+    a server for parser on address, (host, port) for TCP or a path for a
+    Unix socket, with its Batcher already running. call serve_forever
+    '''
+    if isinstance(address, tuple):
+        server = ThreadingHTTPServer(address, ParseHandler)
+    else:
+        server = ThreadingUnixHTTPServer(address, ParseHandler)
+    server.stats = Stats()
+    server.batcher = Batcher(parser, server.stats, window, max_batch)
+    server.verbose = verbose
+    return server
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class ParseClient(object):
+    '''
+    client of a parse server on address, as given to make_server. every
+    call opens its own connection, so one client can be shared by threads
+    '''
+
+    def __init__(self, address, timeout=60):
+        self.address = address
+        self.timeout = timeout
+
+    def connection(self):
+        if isinstance(self.address, tuple):
+            return httplib.HTTPConnection(*self.address, timeout=self.timeout)
+        return UnixHTTPConnection(self.address, self.timeout)
+
+    def request(self, method, path, body=None, content_type='text/plain'):
+        connection = self.connection()
+        try:
+            connection.request(method, path, body, {'Content-Type': content_type})
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise ValueError('%d %s' % (response.status, data.strip()))
+        return data
+
+    def parse(self, tokens):
+        '''
+        CoNLL heads of sentences given as lists of (word, pos) pairs
+        '''
+        data = self.request('POST', '/parse', json.dumps({'sentences': tokens}),
+                            'application/json')
+        return [s['heads'] for s in json.loads(data)['sentences']]
+
+    def parse_conll(self, conll, output='conll'):
+        '''
+        the response to CoNLL lines, CoNLL lines or parsed JSON
+        '''
+        data = self.request('POST', '/parse?format=' + output, conll)
+        return json.loads(data) if output == 'json' else data
+
+    def stats(self):
+        return json.loads(self.request('GET', '/stats'))
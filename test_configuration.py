@@ -0,0 +1,135 @@
+import random
+import pytest
+import util
+from arc_eager import ArcEager
+from arc_standard import ArcStandard
+from configuration import is_projective, projective_mask
+
+
+def dependents(config):
+    '''
+    left_deps and right_deps recomputed from the arcs, nearest first
+    '''
+    n = len(config.sentence)
+    left = [[] for _ in xrange(n + 1)]
+    right = [[] for _ in xrange(n + 1)]
+    for h, d in config.arcs:
+        (left if d < h else right)[h].append(d)
+    return ([sorted(deps, reverse=True) for deps in left],
+            [sorted(deps) for deps in right])
+
+
+def random_walk(arcsys, sentence, rng):
+    config = arcsys.get_initial_config(sentence)
+    yield config
+    while not arcsys.is_finished(config):
+        legal = arcsys.get_legal_transitions(config)
+        if len(legal) == 0:
+            break
+        config = arcsys.take_transition(config.copy(), rng.choice(legal))
+        yield config
+
+
+@pytest.mark.parametrize('arcsys', [ArcStandard(), ArcEager()], ids=['standard', 'eager'])
+def test_incremental_heads_and_dependents(arcsys, dev_set):
+    rng = random.Random(0)
+    for sentence in dev_set[:50]:
+        walk = []
+        for config in random_walk(arcsys, sentence, rng):
+            walk.append((config, list(config.head), dependents(config)))
+        # copies share dependent lists, so later steps must not change
+        # what earlier configurations hold
+        for config, head, (left, right) in walk:
+            assert list(config.head) == head
+            assert [list(deps) for deps in config.left_deps] == left
+            assert [list(deps) for deps in config.right_deps] == right
+            assert [i for i, on in enumerate(config.on_stack) if on] == \
+                sorted(i % (len(sentence) + 1) for i in config.stack)
+
+
+def crosses(heads):
+    arcs = [(min(h, d), max(h, d)) for d, h in enumerate(heads) if h >= 0]
+    return any(l1 < l2 < r1 < r2 for l1, r1 in arcs for l2, r2 in arcs)
+
+
+def test_projective_mask_is_brute_force():
+    rng = random.Random(0)
+    sentences = []
+    for _ in xrange(500):
+        n = rng.randint(1, 9)
+        # heads of other tokens, root or missing, not necessarily a tree
+        sentences.append([rng.choice([h for h in xrange(-2, n) if h != d])
+                          for d in xrange(n)])
+    offsets = [0]
+    for heads in sentences:
+        offsets.append(offsets[-1] + len(heads))
+    mask = projective_mask([h for heads in sentences for h in heads], offsets)
+    assert mask.tolist() == [not crosses(heads) for heads in sentences]
+    assert all(is_projective(heads) == (not crosses(heads)) for heads in sentences[:50])
+
+
+# the set-based costs that configuration.OracleCounts replaced
+
+def left_arc_cost(config, gold):
+    b, s = config.buffer[0], config.stack[-1]
+    if gold.head_of[s] == b:
+        return 0
+    ks = set([gold.head_of[s]] + list(gold.deps_of[s]))
+    return len(ks.intersection(set(config.buffer)))
+
+
+def right_arc_cost(config, gold):
+    b, s = config.buffer[0], config.stack[-1]
+    if gold.head_of[b] == s:
+        return 0
+    stack = list(config.stack)
+    return ((gold.head_of[b] in stack) + (gold.head_of[b] in config.buffer)
+            + len(set(gold.deps_of[b]).intersection(stack)))
+
+
+def shift_cost(config, gold):
+    b = config.buffer[0]
+    return sum((k == gold.head_of[b]) + (k in gold.deps_of[b]) for k in config.stack)
+
+
+def reduce_cost(config, gold):
+    return len(set(gold.deps_of[config.stack[-1]]).intersection(set(config.buffer)))
+
+
+def standard_static_oracle(config, gold):
+    b, s = config.buffer[0], config.stack[-1]
+    missing = gold.arcs - set(config.arcs)
+    if s != -1 and b == gold.head_of[s] and not [t for h, t in missing if h == s]:
+        return [ArcStandard.LEFT]
+    if s == gold.head_of[b] and not [t for h, t in missing if h == b]:
+        return [ArcStandard.RIGHT]
+    return [ArcStandard.SHIFT]
+
+
+EAGER_COSTS = [(ArcEager.LEFT, ArcEager.left_arc_cost, left_arc_cost),
+               (ArcEager.RIGHT, ArcEager.right_arc_cost, right_arc_cost),
+               (ArcEager.SHIFT, ArcEager.shift_cost, shift_cost),
+               (ArcEager.REDUCE, ArcEager.reduce_cost, reduce_cost)]
+
+
+@pytest.mark.parametrize('arcsys', [ArcStandard(), ArcEager()], ids=['standard', 'eager'])
+def test_incremental_costs_are_set_costs(arcsys, train_set):
+    rng = random.Random(0)
+    sentences, gold_configs = util.filter_non_projective(arcsys, train_set)
+    checked = 0
+    for sentence, gold in zip(sentences, gold_configs):
+        for config in random_walk(arcsys, sentence, rng):
+            legal = arcsys.get_legal_transitions(config)
+            if arcsys.is_finished(config) or len(legal) == 0:
+                continue
+            if isinstance(arcsys, ArcStandard):
+                if len(config.stack) > 0:
+                    assert arcsys.static_oracle(config, gold) == \
+                        standard_static_oracle(config, gold)
+                    checked += 1
+                continue
+            for transition, cost, set_cost in EAGER_COSTS:
+                if transition in legal:
+                    assert cost(config, gold) == set_cost(config, gold)
+                    checked += 1
+    assert checked > 1000
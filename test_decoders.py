@@ -0,0 +1,62 @@
+import itertools
+import numpy as np
+import pytest
+import decoders
+
+
+def trees(n):
+    '''
+    heads of every tree over nodes 0..n-1 rooted at 0
+    '''
+    for heads in itertools.product(xrange(n), repeat=n - 1):
+        heads = (-1,) + heads
+        if all(reaches_root(heads, d) for d in xrange(1, n)):
+            yield np.array(heads)
+
+
+def reaches_root(heads, d):
+    seen = set()
+    while d != 0:
+        if d in seen:
+            return False
+        seen.add(d)
+        d = heads[d]
+    return True
+
+
+def matrices(count=200, max_n=6):
+    rng = np.random.RandomState(0)
+    for k in xrange(count):
+        n = rng.randint(2, max_n + 1)
+        # small integers make ties, which the decoders must survive
+        yield rng.randn(n, n) if k % 2 else rng.randint(-2, 3, (n, n)).astype(float)
+
+
+def test_chu_liu_edmonds_is_best_tree():
+    for scores in matrices():
+        heads = decoders.chu_liu_edmonds(scores)
+        assert heads[0] == -1 and reaches_root(heads, len(heads) - 1)
+        best = max(decoders.tree_score(scores, t) for t in trees(len(scores)))
+        assert decoders.tree_score(scores, heads) == pytest.approx(best)
+
+
+def crosses(heads):
+    arcs = [(min(h, d), max(h, d)) for d, h in enumerate(heads) if h >= 0]
+    return any(l1 < l2 < r1 < r2 for l1, r1 in arcs for l2, r2 in arcs)
+
+
+def test_eisner_is_best_projective_tree():
+    for scores in matrices():
+        heads = decoders.eisner(scores)
+        assert heads[0] == -1 and not crosses(heads)
+        assert all(reaches_root(heads, d) for d in xrange(1, len(heads)))
+        best = max(decoders.tree_score(scores, t) for t in trees(len(scores))
+                   if not crosses(t))
+        assert decoders.tree_score(scores, heads) == pytest.approx(best)
+
+
+@pytest.mark.parametrize('n', [50, 200])
+def test_chu_liu_edmonds_returns_a_tree(n):
+    scores = np.random.RandomState(n).randn(n, n)
+    heads = decoders.chu_liu_edmonds(scores)
+    assert all(reaches_root(heads, d) for d in xrange(1, n))
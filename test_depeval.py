@@ -0,0 +1,11 @@
+import depeval
+
+
+def test_punctuation_is_scored_but_not_counted_as_tokens():
+    ref = ([1, -1, 1], [None] * 3, ['NN', 'VB', '.'])
+    out = ([1, -1, 0], [None] * 3, None)
+    with_punct, = depeval.evaluate([ref], [[out]])
+    no_punct, = depeval.evaluate([ref], [[out]], punct=False)
+    assert (with_punct.correct_heads, with_punct.total) == (2, 3)
+    assert (no_punct.correct_heads, no_punct.total) == (2, 2)
+    assert with_punct.tokens == no_punct.tokens == 3
@@ -0,0 +1,20 @@
+import random
+import pytest
+import feature_extractor as fx
+from arc_eager import ArcEager
+from arc_standard import ArcStandard
+
+
+@pytest.mark.parametrize('arcsys', [ArcStandard(), ArcEager()], ids=['standard', 'eager'])
+def test_rich_incremental_is_rich(arcsys, dev_set):
+    rng = random.Random(0)
+    for sentence in dev_set[:100]:
+        # copies share the cache of the first configuration, as in the
+        # parsers, so the groups cached on one step are reused by the next
+        config = arcsys.get_initial_config(sentence)
+        while True:
+            assert fx.rich_incremental(config) == fx.rich(config)
+            legal = arcsys.get_legal_transitions(config)
+            if arcsys.is_finished(config) or len(legal) == 0:
+                break
+            config = arcsys.take_transition(config.copy(), rng.choice(legal))
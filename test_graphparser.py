@@ -0,0 +1,20 @@
+import subprocess
+import sys
+import numpy as np
+from conftest import data_path
+import graphparser
+
+
+def test_edge_features_without_networkx():
+    graphs = list(graphparser.iterCoNLL(data_path('en.tr100')))[:20]
+    examples = list(graphparser.iterEdgeFeatures(data_path('en.tr100')))[:20]
+    for G, ex in zip(graphs, examples):
+        expected = graphparser.graphEdgeFeatures(G)
+        for name in ['indptr', 'indices', 'trueEdges']:
+            assert np.array_equal(getattr(ex, name), getattr(expected, name))
+
+
+def test_graph_command_does_not_load_networkx():
+    code = ('import sys, cli; cli.main(["graph", %r, "-i", "1"]); '
+            'assert "networkx" not in sys.modules' % data_path('en.tr100'))
+    subprocess.check_call([sys.executable, '-c', code], stdout=subprocess.PIPE)
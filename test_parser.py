@@ -0,0 +1,107 @@
+import random
+import numpy as np
+import pytest
+import cli
+import feature_extractor as fx
+import train
+import util
+from arc_standard import ArcStandard
+from parser import SimpleParser, HashedParser, load_parser
+
+
+@pytest.fixture
+def parser(trained):
+    _, parser = trained
+    yield parser
+    parser.beam_width = 1
+
+
+def test_beam_width_one_is_greedy(parser, dev_set):
+    for sentence in dev_set[:200]:
+        greedy = parser.predict(sentence)
+        assert parser.decode_beam(sentence).arcs == greedy
+
+
+def test_beam_ends_finished(trained, parser, dev_set):
+    # en.dev sentence 40 used to come back from a configuration that got
+    # stuck before finishing, one head short of greedy decoding
+    arcsys, _ = trained
+    parser.beam_width = 4
+    for sentence in [dev_set[40]] + dev_set[:100]:
+        config = parser.decode_beam(sentence)
+        if arcsys.is_finished(config):
+            continue
+        # only when no hypothesis finished: then it is greedy decoding's
+        assert config.arcs == parser.decode(sentence).arcs
+
+
+def test_average_without_updates(dev_set):
+    arcsys = ArcStandard()
+    simple = SimpleParser(arcsys, fx.baseline, arcsys.static_oracle)
+    simple.update_rows(fx.baseline(arcsys.get_initial_config(dev_set[0])))
+    for parser in [simple, HashedParser(arcsys, fx.baseline, arcsys.static_oracle, 2 ** 10)]:
+        parser.average_weights()
+        assert not np.isnan(parser.weights).any()
+
+
+def test_train_after_loading_an_empty_model(tmpdir, train_set):
+    arcsys = ArcStandard()
+    SimpleParser(arcsys, fx.baseline, arcsys.static_oracle).save(str(tmpdir))
+    parser = load_parser(str(tmpdir), arcsys, fx.baseline, arcsys.static_oracle)
+    assert parser.n_rows == 0
+    sentence = train_set[0]
+    parser.train(sentence, arcsys.get_gold_config(sentence))
+    assert parser.n_rows > 0 and len(parser.weights) >= parser.n_rows
+
+
+def test_cutoff_freezes_and_compacts(tmpdir, train_set, dev_set):
+    arcsys = ArcStandard()
+    parser = SimpleParser(arcsys, fx.baseline, arcsys.static_oracle)
+    sentences, gold_configs = util.filter_non_projective(arcsys, train_set)
+    kept = parser.prune(parser.count_features(sentences, gold_configs), 2)
+    assert parser.frozen and parser.n_rows == kept
+    random.seed(321)
+    train.train_parser(parser, sentences, gold_configs, 2, False, 1, False)
+    # features seen fewer than twice are skipped, not added
+    assert parser.n_rows == kept
+    parser.average_weights()
+    expected = [parser.predict(s) for s in dev_set[:100]]
+    parser.compact()
+    assert parser.n_rows <= kept
+    parser.save(str(tmpdir))
+    loaded = load_parser(str(tmpdir), arcsys, fx.baseline, arcsys.static_oracle)
+    assert [loaded.predict(s) for s in dev_set[:100]] == expected
+
+
+def test_predict_batch_is_predict(trained, dev_set):
+    _, parser = trained
+    sentences = dev_set[:100]
+    assert parser.predict_batch(sentences) == [parser.predict(s) for s in sentences]
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_output_is_serial_output(trained, dev_set, workers):
+    _, parser = trained
+    sentences = dev_set[:600]
+    expected = ''.join(util.format_conll(s, a) for s, a in
+                       train.parse_stream(parser, sentences, 1, 200))
+    for parsed in [train.parse_stream(parser, sentences, workers, 200),
+                   cli.parse_stream(parser, sentences, workers, 256)]:
+        assert ''.join(util.format_conll(s, a) for s, a in parsed) == expected
+
+
+@pytest.mark.parametrize('make', [
+    lambda a: SimpleParser(a, fx.baseline, a.static_oracle),
+    lambda a: HashedParser(a, fx.baseline, a.static_oracle, 2 ** 10)])
+def test_score_batch_with_empty_feature_sets(make, dev_set):
+    arcsys = ArcStandard()
+    parser = make(arcsys)
+    parser.weights[:] = np.random.RandomState(0).randn(*parser.weights.shape)
+    features = parser.fex(arcsys.get_initial_config(dev_set[0]))
+    parser.update_rows(features)
+    empty = features[:0] if isinstance(features, np.ndarray) else {}
+    for batch in [[empty], [features, empty], [empty, features, empty], [empty, empty]]:
+        scores = parser.score_batch(batch)
+        assert len(scores) == len(batch)
+        for f, s in zip(batch, scores):
+            assert np.allclose(s, parser.score(f))
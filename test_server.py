@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import threading
+import pytest
+import server
+import util
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def client(request, trained):
+    _, parser = trained
+    if request.param == 'tcp':
+        address = ('127.0.0.1', 0)
+    else:
+        address = os.path.join(tempfile.mkdtemp(), 'parse.sock')
+    parse_server = server.make_server(parser, address)
+    thread = threading.Thread(target=parse_server.serve_forever)
+    thread.start()
+    yield server.ParseClient(parse_server.server_address)
+    parse_server.shutdown()
+    parse_server.server_close()
+    thread.join()
+    if request.param == 'unix':
+        os.remove(address)
+
+
+def test_answers_match_predict_batch(trained, client, dev_set):
+    _, parser = trained
+    sentences = dev_set[:20]
+    arcs = parser.predict_batch(sentences)
+    expected = [server.heads_of(s, a) for s, a in zip(sentences, arcs)]
+    tokens = [[(word[4], word[1]) for word in s] for s in sentences]
+    assert client.parse(tokens) == expected
+    conll = ''.join(util.format_conll(s, []) for s in sentences)
+    reply = client.parse_conll(conll, 'json')
+    assert [s['heads'] for s in reply['sentences']] == expected
+    assert client.parse_conll(conll) == ''.join(util.format_conll(s, a)
+                                                for s, a in zip(sentences, arcs))
+    stats = client.stats()
+    assert stats['requests'] == 3 and stats['sentences'] == 3 * len(sentences)
+
+
+def test_non_ascii_words(client):
+    body = json.dumps({'sentences': [[[u'café', 'NN'], ['au', 'IN'], ['lait', 'NN']]]})
+    reply = client.request('POST', '/parse?format=conll', body, 'application/json')
+    assert reply.splitlines()[0].split('\t')[1] == u'café'.encode('utf-8')
+    assert len(client.parse([[(u'café', 'NN')]])[0]) == 1
+
+
+@pytest.mark.parametrize('sentences', [[[[1, 'NN']]], [[[None, 'NN']]], [[['dog', None]]],
+                                       [[['dog']]], [['dog']], 'dog', 3])
+def test_bad_tokens_are_rejected(client, sentences):
+    with pytest.raises(ValueError) as e:
+        client.request('POST', '/parse', json.dumps({'sentences': sentences}),
+                       'application/json')
+    assert str(e.value).startswith('400')
+    assert client.stats()['errors'] == 1
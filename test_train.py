@@ -0,0 +1,82 @@
+import os
+import random
+import numpy as np
+import pytest
+import util
+from cli import build_parser
+from parser import HashedParser, load_checkpoint
+from train import parse_args, train_parser
+
+
+def train(system, train_set, iters, checkpoint=None, workers=1, state=None, parser=None,
+          replay=False):
+    arcsys, fresh, can_explore = build_parser(system)
+    sentences, gold_configs = util.filter_non_projective(arcsys, train_set[:40])
+    start_iter, order = 0, None
+    if state is None:
+        random.seed(321)
+    else:
+        random.setstate(state['rng'])
+        start_iter, order = state['epoch'] + 1, state['order']
+    parser = parser or fresh
+    train_parser(parser, sentences, gold_configs, iters, can_explore, 1, False, workers,
+                 replay=replay, checkpoint=checkpoint, start_iter=start_iter, order=order)
+    return arcsys, parser
+
+
+@pytest.mark.parametrize('hash_bits', [0, 12])
+def test_replay_is_live_training(hash_bits, train_set):
+    def parser():
+        arcsys, simple_parser, _ = build_parser('standard')
+        if hash_bits:
+            return HashedParser(arcsys, simple_parser.fex, simple_parser.oracle, 2 ** hash_bits)
+        return simple_parser
+    _, live = train('standard', train_set, 3, parser=parser())
+    _, replayed = train('standard', train_set, 3, parser=parser(), replay=True)
+    assert replayed.current_update == live.current_update
+    # recording adds every feature of the oracle paths up front, so the
+    # rows of the dict model are compared by feature
+    if hash_bits:
+        rows = live_rows = np.arange(live.n_rows)
+    else:
+        live_rows = np.arange(live.n_rows)
+        rows = np.array([replayed.index[f] for f in live.features])
+        unseen = np.setdiff1d(np.arange(replayed.n_rows), rows)
+        assert not replayed.weights[unseen].any()
+    for name in ['weights', 'previous_update', 'weight_accumulate']:
+        assert np.array_equal(getattr(replayed, name)[rows], getattr(live, name)[live_rows])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_resume_is_uninterrupted(workers, train_set, tmpdir):
+    path = str(tmpdir)
+    _, full = train('eager', train_set, 4, workers=workers)
+    arcsys, first = train('eager', train_set, 2, path, workers)
+    parser, state = load_checkpoint(path, arcsys, first.fex, first.oracle)
+    _, resumed = train('eager', train_set, 4, path, workers, state, parser)
+    n = full.n_rows
+    assert resumed.n_rows == n and resumed.current_update == full.current_update
+    for name in ['weights', 'previous_update', 'weight_accumulate']:
+        assert np.array_equal(getattr(resumed, name)[:n], getattr(full, name)[:n])
+    deltas = [f for f in os.listdir(path) if f.startswith('delta-')]
+    # mixing moves every row, so each epoch's delta replaces the earlier ones
+    assert len(deltas) == (4 if workers == 1 else 1)
+
+
+def test_resume_needs_checkpoint():
+    with pytest.raises(SystemExit):
+        parse_args(['--resume'])
+    assert parse_args(['--resume', '--checkpoint', 'ck']).resume
+
+
+@pytest.mark.parametrize('argv', [['-b', '12', '-f', '2'],
+                                  ['-b', '12', '--template_cutoffs', 's0w=2']])
+def test_cutoffs_need_the_feature_index(argv):
+    with pytest.raises(SystemExit):
+        parse_args(argv)
+
+
+def test_replay_needs_a_static_system():
+    with pytest.raises(SystemExit):
+        parse_args(['-r'], can_explore=True)
+    assert parse_args(['-r']).replay
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import depeval
+import util
+from conftest import data_path
+
+
+def write_sentences(path, count, trailing_blank=True):
+    '''
+    the first count sentences of en.tr100 as written there, returned as
+    read by read_conll_data
+    '''
+    with open(data_path('en.tr100')) as f:
+        blocks = f.read().split('\n\n')[:count]
+    with open(path, 'w') as f:
+        f.write('\n\n'.join(blocks) + ('\n\n' if trailing_blank else '\n'))
+    return util.read_conll_data(data_path('en.tr100'))[:count]
+
+
+def test_last_sentence_without_blank_line(tmpdir):
+    path = str(tmpdir.join('no_blank.conll'))
+    sentences = write_sentences(path, 3, trailing_blank=False)
+    assert util.read_conll_data(path) == sentences
+    assert [heads for heads, _, _ in depeval.conll_sentences(path)] == \
+        [[w[2] for w in s] for s in sentences]
+    assert list(util.load_corpus(path)) == sentences
+
+
+def test_cached_corpus_is_read_conll_data(tmpdir):
+    path = str(tmpdir.join('corpus.conll'))
+    sentences = write_sentences(path, 20)
+    built = util.load_corpus(path)
+    cached = util.load_corpus(path)
+    # the second load memory-maps the cache instead of parsing the file
+    assert isinstance(cached.heads, np.memmap)
+    assert list(built) == list(cached) == sentences == util.read_conll_data(path)
+    assert cached.projective.tolist() == built.projective.tolist()
+
+
+def test_cache_is_rebuilt_when_the_file_changes(tmpdir):
+    path = str(tmpdir.join('corpus.conll'))
+    write_sentences(path, 20)
+    util.load_corpus(path)
+    # a different size
+    sentences = write_sentences(path, 10)
+    assert list(util.load_corpus(path)) == sentences
+    # the same size, only the mtime tells the files apart
+    with open(path) as f:
+        text = f.read()
+    changed = text.replace('\tNo\t', '\tNO\t', 1)
+    assert len(changed) == len(text) and changed != text
+    with open(path, 'w') as f:
+        f.write(changed)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert list(util.load_corpus(path)) == util.read_conll_data(path)
+    assert util.load_corpus(path)[0][0][4] == 'NO'
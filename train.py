@@ -1,12 +1,22 @@
 import argparse
+import cProfile
+import json
 import random
 import time
 import util
 import os
+import depeval
+import profiling
+from multiprocessing import Pool
+from parser import HashedParser, Replay, load_parser, load_checkpoint
 
+# set before forking the Pool in train_epoch_mixed, so that workers read
+# the current weights and their shard from the parent's memory
+_worker_parser = None
+_worker_shards = None
 
-def parse_args():
-    parser = argparse.ArgumentParser()
+
+def add_arguments(parser):
     parser.add_argument("train_file", nargs="?", type=str, default="en.tr100")
     parser.add_argument("test_file", nargs="?", type=str, default="en.tst")
     parser.add_argument("test_output", nargs="?", type=str, default="en.tst.out")
@@ -15,82 +25,308 @@ def parse_args():
     parser.add_argument("-v", "--verbose", action='store_true', default=False)
     parser.add_argument("-e", "--explore", type=int, default=1)
     parser.add_argument("-s", "--static", action='store_true', default=False)
-    return parser.parse_args()
+    parser.add_argument("-b", "--hash_bits", type=int, default=0,
+                        help="use 2**hash_bits hashed features instead of the dict model")
+    parser.add_argument("-w", "--beam_width", type=int, default=1)
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of processes for parsing the dev and test sets")
+    parser.add_argument("-t", "--train_workers", type=int, default=1,
+                        help="train on this many shards with iterative parameter mixing")
+    parser.add_argument("-o", "--save_model", type=str, default=None,
+                        help="directory to save the averaged model to")
+    parser.add_argument("-l", "--load_model", type=str, default=None,
+                        help="parse with a saved model instead of training")
+    parser.add_argument("-c", "--cache", action='store_true', default=False,
+                        help="read the training file through its binary corpus cache")
+    parser.add_argument("-r", "--replay", action='store_true', default=False,
+                        help="record static-oracle paths once and replay them every epoch")
+    parser.add_argument("-p", "--no_punct", action='store_true', default=False,
+                        help="leave punctuation out of the dev evaluation")
+    parser.add_argument("-f", "--cutoff", type=int, default=0,
+                        help="only keep features seen at least this often on the oracle paths")
+    parser.add_argument("--template_cutoffs", type=str, nargs="*", default=[],
+                        help="cutoffs for single templates, as template=count")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help="save the training state to this directory after every epoch")
+    parser.add_argument("--resume", action='store_true', default=False,
+                        help="continue training after the last epoch saved in --checkpoint")
+    parser.add_argument("--init-model", type=str, default=None,
+                        help="start training from a model saved with -o or a --checkpoint "
+                             "directory instead of from zero weights")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="time the phases of every epoch and of parsing, print them "
+                             "and write them to this JSON file (not inside -t/-j workers)")
+    parser.add_argument("--cprofile", type=str, default=None,
+                        help="dump cProfile stats of the whole run to this file")
+
+
+def check_arguments(parser, args, can_explore=False):
+    '''
+    report options that only make sense together through parser.error,
+    can_explore telling whether the system trains with exploration
+    '''
+    if args.replay and can_explore:
+        parser.error('-r needs a system that trains without exploration')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs --checkpoint')
+    if args.hash_bits and (args.cutoff or args.template_cutoffs):
+        parser.error('-f/--template_cutoffs need the feature index, not -b')
+
+
+def parse_args(argv=None, can_explore=False):
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    check_arguments(parser, args, can_explore)
+    return args
 
 
 def print_result(sentence, arcs, outfile):
-    head_of = dict()
-    for h, t in arcs:
-        head_of[t] = h
-    for i, word in enumerate(sentence):
-        s = str(i+1) + '\t' + word[4] + '\t_\t' + word[1] + '\t' + word[5] + '\t_\t'
-        if i in head_of:
-            s += str(head_of[i] + 1)
+    outfile.write(util.format_conll(sentence, arcs))
+
+
+def parse_stream(parser, sentences, workers=1, chunk_size=4096):
+    '''
+    yield (sentence, arcs) for a stream of sentences, parsing them
+    chunk_size at a time so that only one chunk is held in memory
+    with workers > 1, one worker pool parses all the chunks
+    '''
+    pool = parser.worker_pool(workers) if workers > 1 else None
+    try:
+        for chunk in util.chunks(sentences, chunk_size):
+            for sentence, arcs in zip(chunk, parser.predict_parallel(chunk, workers, pool)):
+                yield sentence, arcs
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+def write_stream(writer, parsed):
+    '''
+    write (sentence, arcs) pairs to writer as they pass through
+    '''
+    for sentence, arcs in parsed:
+        writer.write(sentence, arcs)
+        yield sentence, arcs
+
+
+def train_epoch(parser, train_set, train_gold_configs):
+    '''
+    one pass of the perceptron over the training set, where gold configs
+    may have been replaced by their Replays (see SimpleParser.record)
+    '''
+    total = 0
+    correct = 0
+    for sentence, gold_config in zip(train_set, train_gold_configs):
+        if isinstance(gold_config, Replay):
+            t, c = parser.train_replay(gold_config)
         else:
-            s += '_'
-        s += '\t_\t_\t_\n'
-        outfile.write(s)
-    outfile.write('\n')
+            t, c = parser.train(sentence, gold_config)
+        total += t
+        correct += c
+    return total, correct
 
 
-def main(arcsys, parser, can_explore):
-    args = parse_args()
-    random.seed(321)
-    train_set = util.read_conll_data(args.train_file)
-    test_set = util.read_conll_data(args.test_file)
-    
-    if args.dev_file:
-        valid_set = util.read_conll_data(args.dev_file)
-    else:
-        valid_set = None
-
-    # training
-    train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set)
-    if args.verbose:
-        print 'feature size', 
-        print len(parser.fex(arcsys.get_initial_config(train_set[0])))
-    for curr_iter in xrange(args.iters):
-        if can_explore and curr_iter > args.explore and parser.exploring == False:
+def _train_shard(args):
+    shard, seed = args
+    random.seed(seed)
+    parser = _worker_parser
+    parser.reset_averaging()
+    total, correct = train_epoch(parser, *_worker_shards[shard])
+    return total, correct, parser.shard_state()
+
+
+def train_epoch_mixed(parser, train_set, train_gold_configs, workers):
+    '''
+    one epoch of the distributed perceptron with iterative parameter
+    mixing (McDonald et al., 2010): each worker trains its own shard from
+    the current weights, then the shards' weights are averaged
+    '''
+    global _worker_parser, _worker_shards
+    _worker_parser = parser
+    _worker_shards = [(train_set[w::workers], train_gold_configs[w::workers])
+                      for w in xrange(workers)]
+    seed = random.randint(0, 2 ** 31)
+    pool = Pool(workers)
+    try:
+        results = pool.map(_train_shard, [(w, seed + w) for w in xrange(workers)])
+    finally:
+        pool.close()
+        pool.join()
+        _worker_parser = None
+        _worker_shards = None
+    parser.mix([state for _, _, state in results])
+    return sum(t for t, _, _ in results), sum(c for _, c, _ in results)
+
+
+def train_parser(parser, train_set, train_gold_configs, iters,
+                 can_explore, explore, verbose, workers=1, callback=None,
+                 replay=False, checkpoint=None, start_iter=0, order=None):
+    '''
+    run the perceptron over the shuffled training set for iters epochs,
+    exploring after the first explore epochs if the oracle allows it
+    with workers > 1 every epoch is trained by train_epoch_mixed
+    with replay, every sentence's oracle path is recorded once up front
+    and later epochs only score and update (static oracle, no exploring)
+    callback, if given, is called with the epoch number after each epoch
+    with checkpoint, the state after every epoch is saved to that
+    directory; start_iter and order (the training set order it was
+    saved with) continue from such a checkpoint
+    weights are left unaveraged
+    '''
+    if replay:
+        # check_arguments rejects this on the command line
+        if can_explore:
+            raise ValueError('replay cannot be combined with exploration')
+        record_start = time.time()
+        train_gold_configs = [parser.record(sentence, gold_config) for sentence, gold_config
+                              in zip(train_set, train_gold_configs)]
+        if verbose:
+            print 'recorded oracle paths in', time.time() - record_start
+    if order is None:
+        order = range(len(train_set))
+    original = train_set, train_gold_configs
+    for curr_iter in xrange(start_iter, iters):
+        if can_explore and curr_iter > explore and parser.exploring == False:
             parser.exploring = True
-            if args.verbose:
+            if verbose:
                 print 'start exploring'
         idx = list(range(len(train_set)))
         random.shuffle(idx)
-        train_set = [train_set[i] for i in idx]
-        train_gold_configs = [train_gold_configs[i] for i in idx]
-        total= 0.0
-        correct = 0.0
+        order = [order[i] for i in idx]
+        train_set = [original[0][i] for i in order]
+        train_gold_configs = [original[1][i] for i in order]
         epoch_start = time.time()
-        for sentence, gold_config in zip(train_set, train_gold_configs):
-            t, c = parser.train(sentence, gold_config)
-            total += t
-            correct += c
+        if workers > 1:
+            total, correct = train_epoch_mixed(parser, train_set,
+                                               train_gold_configs, workers)
+        else:
+            total, correct = train_epoch(parser, train_set, train_gold_configs)
+        total, correct = float(total), float(correct)
         epoch_end = time.time()
-        if args.verbose:
+        if verbose:
             print curr_iter, correct / total, epoch_end - epoch_start
+        if checkpoint is not None:
+            parser.checkpoint(checkpoint, curr_iter, order, random.getstate())
+        if callback is not None:
+            callback(curr_iter)
+
+
+def main(arcsys, parser, can_explore, args=None):
+    if args is None:
+        args = parse_args(can_explore=can_explore)
+    if args.cprofile:
+        profile = cProfile.Profile()
+        profile.enable()
+    run(args, arcsys, parser, can_explore)
+    if args.cprofile:
+        profile.disable()
+        profile.dump_stats(args.cprofile)
+
+
+def run(args, arcsys, parser, can_explore):
+    random.seed(321)
+    timer = profiling.PhaseTimer() if args.profile else None
+    report = {'train': []}
+
+    def report_epoch(curr_iter):
+        snapshot = timer.snapshot()
+        snapshot['epoch'] = curr_iter
+        report['train'].append(snapshot)
+        print 'epoch', curr_iter, 'phases:'
+        print timer.format(snapshot)
+        timer.reset()
 
-    parser.average_weights()
+    if args.load_model:
+        load_start = time.time()
+        parser = load_parser(args.load_model, arcsys, parser.fex, parser.oracle)
+        if args.verbose:
+            print 'model loaded in', time.time() - load_start
+    else:
+        start_iter, order, rng = 0, None, None
+        resume = args.checkpoint and os.path.exists(os.path.join(args.checkpoint,
+                                                                 'checkpoint.json'))
+        if resume and not args.resume:
+            raise ValueError('%s already holds a checkpoint, pass --resume to continue it'
+                             % args.checkpoint)
+        if resume:
+            parser, state = load_checkpoint(args.checkpoint, arcsys, parser.fex, parser.oracle)
+            start_iter, order, rng = state['epoch'] + 1, state['order'], state['rng']
+            if args.verbose:
+                print 'resuming after epoch', state['epoch']
+        elif args.init_model:
+            if os.path.exists(os.path.join(args.init_model, 'checkpoint.json')):
+                parser, _ = load_checkpoint(args.init_model, arcsys, parser.fex, parser.oracle)
+            else:
+                parser = load_parser(args.init_model, arcsys, parser.fex, parser.oracle)
+        elif args.hash_bits:
+            parser = HashedParser(arcsys, parser.fex, parser.oracle, 2 ** args.hash_bits)
+        if args.cache:
+            train_set = util.load_corpus(args.train_file)
+        else:
+            train_set = util.read_conll_data(args.train_file)
+
+        # training
+        train_set, train_gold_configs = util.filter_non_projective(arcsys, train_set,
+                                                                    args.verbose)
+        if args.verbose:
+            print 'feature size', 
+            print len(parser.fex(arcsys.get_initial_config(train_set[0])))
+        if (args.cutoff or args.template_cutoffs) and not resume:
+            counts = parser.count_features(train_set, train_gold_configs)
+            template_cutoffs = dict((t, int(c)) for t, c in
+                                    (tc.split('=') for tc in args.template_cutoffs))
+            kept = parser.prune(counts, args.cutoff, template_cutoffs)
+            if args.verbose:
+                print 'kept', kept, 'of', len(counts), 'features'
+        if timer is not None:
+            profiling.instrument(parser, timer)
+            timer.reset()
+        if rng is not None:
+            random.setstate(rng)
+        train_parser(parser, train_set, train_gold_configs, args.iters,
+                     can_explore, args.explore, args.verbose, args.train_workers,
+                     report_epoch if timer is not None else None,
+                     replay=args.replay, checkpoint=args.checkpoint,
+                     start_iter=start_iter, order=order)
+
+        parser.average_weights()
+        if parser.frozen:
+            parser.compact()
+            if args.verbose:
+                print 'features after training', parser.n_rows
+        if args.save_model:
+            parser.save(args.save_model)
+    parser.beam_width = args.beam_width
+    if timer is not None:
+        if args.load_model:
+            profiling.instrument(parser, timer)
+        timer.reset()
 
     # validation with dev dataset
-    if valid_set:
-        total_arcs, correct_arcs = 0, 0
-        valid_gold_configs = [arcsys.get_gold_config(s) for s in valid_set]
-        valid_output = open(args.dev_file + '.out', 'w')
-        for sentence, gold_config in zip(valid_set, valid_gold_configs):
-            arcs = parser.predict(sentence)
-            print_result(sentence, arcs, valid_output)
-            correct = set(arcs).intersection(gold_config.arcs)
-            total_arcs += len(gold_config.arcs)
-            correct_arcs += len(correct)
-        valid_output.close()
+    if args.dev_file:
+        valid_start = time.time()
+        valid_set = util.iter_conll_data(args.dev_file)
+        with util.ConllWriter(args.dev_file + '.out') as valid_output:
+            parsed = parse_stream(parser, valid_set, args.workers)
+            result = depeval.evaluate_parsed(write_stream(valid_output, parsed),
+                                             not args.no_punct)
+        valid_end = time.time()
         if args.verbose:
-            print 'eval:', str(correct_arcs) + '/' + str(total_arcs),
-            print correct_arcs * 1.0 / total_arcs
+            print 'tokens/sec:', result.tokens / (valid_end - valid_start)
+            print 'eval:', str(result.correct_heads) + '/' + str(result.total),
+            print result.uas
 
     # testing
-    test_output = open(args.test_output, 'w')
-    for sentence in test_set:
-        arcs = parser.predict(sentence)
-        print_result(sentence, arcs, test_output)
-    test_output.close()
+    test_set = util.iter_conll_data(args.test_file)
+    with util.ConllWriter(args.test_output) as test_output:
+        for sentence, arcs in parse_stream(parser, test_set, args.workers):
+            test_output.write(sentence, arcs)
 
+    if timer is not None:
+        report['parse'] = timer.snapshot()
+        print 'parsing phases:'
+        print timer.format(report['parse'])
+        with open(args.profile, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
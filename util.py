@@ -1,3 +1,8 @@
+import os
+import json
+import numpy as np
+from configuration import projective_mask
+
 ID      = 0
 FORM    = 1
 LEMMA   = 2
@@ -9,33 +14,266 @@ DEPREL  = 7
 PHEAD   = 8
 PDEPREL = 9
 
-def read_conll_data(file_path):
-    sentences = []
+def iter_conll_data(file_path):
+    '''
+    yield the sentences of a CoNLL file one at a time
+    '''
     with open(file_path) as f:
-        sentence = []
-        for row in f.readlines():
-            row = row.lstrip().rstrip().split('\t')
-            if len(row) == 1:
-                # end of sentence
-                sentences.append(sentence)
-                sentence = []
-                continue
-            if row[HEAD] != '_':
-                sentence.append((row[FORM].lower(), row[CPOSTAG], 
-                                int(row[HEAD]) - 1, row[DEPREL], row[FORM], row[POSTAG]))
-            else:
-                sentence.append((row[FORM].lower(), row[CPOSTAG], 
-                                row[HEAD], row[DEPREL], row[FORM], row[POSTAG]))
-
-    return sentences
-
-
-def filter_non_projective(arcsys, sentences):
-    gold_configs = []
-    projective = []
-    for sentence in sentences:
-        gold_config = arcsys.get_gold_config(sentence)
-        if not arcsys.is_not_projective(gold_config):
-            gold_configs.append(gold_config)
-            projective.append(sentence)
-    return projective, gold_configs
+        for sentence in iter_conll_lines(f):
+            yield sentence
+
+
+def iter_conll_lines(lines):
+    '''
+    yield the sentences of CoNLL lines one at a time
+    every blank line ends a sentence, and a last sentence that is not
+    followed by a blank line is yielded as well
+    '''
+    sentence = []
+    for row in lines:
+        row = row.lstrip().rstrip().split('\t')
+        if len(row) == 1:
+            # end of sentence
+            yield sentence
+            sentence = []
+            continue
+        if row[HEAD] != '_':
+            sentence.append((row[FORM].lower(), row[CPOSTAG], 
+                            int(row[HEAD]) - 1, row[DEPREL], row[FORM], row[POSTAG]))
+        else:
+            sentence.append((row[FORM].lower(), row[CPOSTAG], 
+                            row[HEAD], row[DEPREL], row[FORM], row[POSTAG]))
+    if len(sentence) > 0:
+        yield sentence
+
+
+def tagged_sentence(tokens):
+    '''
+    a sentence as read from CoNLL, unparsed, from (word, pos) pairs
+    '''
+    return [(word.lower(), pos, '_', '_', word, pos) for word, pos in tokens]
+
+
+def read_conll_data(file_path):
+    return list(iter_conll_data(file_path))
+
+
+def chunks(iterable, size, first=None):
+    '''
+    split an iterable into lists of at most size items
+    with first, the lists start at first items and double up to size
+    '''
+    chunk = []
+    limit = first or size
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == limit:
+            yield chunk
+            chunk = []
+            limit = min(limit * 2, size)
+    if len(chunk) > 0:
+        yield chunk
+
+
+def format_conll(sentence, arcs):
+    '''
+    the CoNLL lines of a parsed sentence, followed by a blank line
+    '''
+    head_of = dict()
+    for h, t in arcs:
+        head_of[t] = h
+    lines = []
+    for i, word in enumerate(sentence):
+        s = str(i+1) + '\t' + word[4] + '\t_\t' + word[1] + '\t' + word[5] + '\t_\t'
+        if i in head_of:
+            s += str(head_of[i] + 1)
+        else:
+            s += '_'
+        s += '\t_\t_\t_\n'
+        lines.append(s)
+    lines.append('\n')
+    return ''.join(lines)
+
+
+class ConllWriter(object):
+    '''
+    writes parsed sentences to a CoNLL file, buffer_size sentences at a time
+    '''
+
+    def __init__(self, file_path, buffer_size=1024):
+        self.outfile = open(file_path, 'w')
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def write(self, sentence, arcs):
+        self.buffer.append(format_conll(sentence, arcs))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(''.join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+NO_HEAD = -2
+CACHE_VERSION = 1
+
+
+class Corpus(object):
+    '''
+    a CoNLL file as columns of interned ids plus sentence offsets, usually
+    memory-mapped from its cache (see load_corpus). sentence i is rebuilt
+    as the usual list of tuples when it is accessed
+    '''
+
+    COLUMNS = ['offsets', 'words', 'cpos', 'pos', 'heads', 'labels', 'projective']
+
+    def __init__(self, columns, words, tags, labels):
+        self.columns = columns
+        self.offsets = columns['offsets']
+        self.word_ids = columns['words']
+        self.cpos_ids = columns['cpos']
+        self.pos_ids = columns['pos']
+        self.heads = columns['heads']
+        self.label_ids = columns['labels']
+        self.projective = columns['projective']
+        self.words = words
+        self.lower_words = [w.lower() for w in words]
+        self.tags = tags
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _tokens(self, start, end):
+        '''
+        word tuples of tokens start to end, built a column at a time
+        '''
+        heads = ['_' if h == NO_HEAD else h for h in self.heads[start:end].tolist()]
+        words = self.word_ids[start:end].tolist()
+        return zip(map(self.lower_words.__getitem__, words),
+                   map(self.tags.__getitem__, self.cpos_ids[start:end].tolist()),
+                   heads,
+                   map(self.labels.__getitem__, self.label_ids[start:end].tolist()),
+                   map(self.words.__getitem__, words),
+                   map(self.tags.__getitem__, self.pos_ids[start:end].tolist()))
+
+    def __getitem__(self, i):
+        return self._tokens(self.offsets[i], self.offsets[i + 1])
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        tokens = self._tokens(offsets[0], offsets[-1])
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield tokens[start:end]
+
+    def select(self, indices):
+        '''
+        the sentences at the given indices, as a list
+        '''
+        sentences = list(self)
+        return [sentences[i] for i in indices]
+
+    def gold_heads(self, i):
+        return self.heads[self.offsets[i]:self.offsets[i + 1]]
+
+
+def build_corpus(file_path):
+    '''
+    read a CoNLL file into a Corpus, interning words, tags and labels
+    '''
+    vocabs = [{}, {}, {}]
+    def intern(vocab, s):
+        i = vocab.get(s)
+        if i is None:
+            i = vocab[s] = len(vocab)
+        return i
+    columns = dict((name, []) for name in ['words', 'cpos', 'pos', 'heads', 'labels'])
+    offsets = [0]
+    for sentence in iter_conll_data(file_path):
+        heads = [NO_HEAD if word[2] == '_' else word[2] for word in sentence]
+        for word, head in zip(sentence, heads):
+            columns['words'].append(intern(vocabs[0], word[4]))
+            columns['cpos'].append(intern(vocabs[1], word[1]))
+            columns['pos'].append(intern(vocabs[1], word[5]))
+            columns['heads'].append(head)
+            columns['labels'].append(intern(vocabs[2], word[3]))
+        offsets.append(offsets[-1] + len(sentence))
+    columns = dict((name, np.array(values, dtype=np.int32))
+                   for name, values in columns.items())
+    columns['offsets'] = np.array(offsets, dtype=np.int64)
+    columns['projective'] = projective_mask(columns['heads'], columns['offsets'])
+    words, tags, labels = [sorted(v, key=v.get) for v in vocabs]
+    return Corpus(columns, words, tags, labels)
+
+
+def load_corpus(file_path):
+    '''
+    the Corpus of a CoNLL file, from the cache directory next to it
+    (file_path + '.cache'). the cache is rebuilt when the file's size or
+    mtime changed, and its columns are memory-mapped
+    '''
+    cache = file_path + '.cache'
+    stat = os.stat(file_path)
+    key = {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime}
+    try:
+        with open(os.path.join(cache, 'meta.json')) as f:
+            fresh = json.load(f) == key
+    except (IOError, ValueError):
+        fresh = False
+    if not fresh:
+        corpus = build_corpus(file_path)
+        if not os.path.isdir(cache):
+            os.makedirs(cache)
+        for name, column in corpus.columns.items():
+            np.save(os.path.join(cache, name + '.npy'), column)
+        for name in ['words', 'tags', 'labels']:
+            with open(os.path.join(cache, name), 'w') as f:
+                f.write('\n'.join(getattr(corpus, name)))
+        # the key goes last, so an interrupted write is rebuilt next time
+        with open(os.path.join(cache, 'meta.json'), 'w') as f:
+            json.dump(key, f)
+        return corpus
+    columns = dict((name, np.load(os.path.join(cache, name + '.npy'), mmap_mode='r'))
+                   for name in Corpus.COLUMNS)
+    vocabs = []
+    for name in ['words', 'tags', 'labels']:
+        with open(os.path.join(cache, name)) as f:
+            text = f.read()
+            vocabs.append(text.split('\n') if text else [])
+    return Corpus(columns, *vocabs)
+
+
+def partition_projective(sentences):
+    '''
+    indices of the projective and of the non-projective sentences
+    '''
+    if isinstance(sentences, Corpus):
+        # projectivity was computed when the corpus was built
+        mask = np.asarray(sentences.projective)
+    else:
+        heads = [word[2] for sentence in sentences for word in sentence]
+        offsets = np.cumsum([0] + [len(sentence) for sentence in sentences])
+        mask = projective_mask(heads, offsets)
+    return np.flatnonzero(mask).tolist(), np.flatnonzero(~mask).tolist()
+
+
+def filter_non_projective(arcsys, sentences, verbose=False):
+    kept, dropped = partition_projective(sentences)
+    if verbose:
+        print 'dropped', len(dropped), 'non-projective sentences:', dropped
+    if isinstance(sentences, Corpus):
+        projective = sentences.select(kept)
+    else:
+        projective = [sentences[i] for i in kept]
+    return projective, [arcsys.get_gold_config(s) for s in projective]